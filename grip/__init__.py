@@ -20,30 +20,56 @@ from .api import (
     clear_cache, create_app, export, render_content, render_page, serve)
 from .app import Grip
 from .assets import GitHubAssetManager, ReadmeAssetManager
+from .blocks import iter_blocks, split_blocks
+from .breaker import CircuitBreaker
+from .cache import RenderCache, SingleFlight
 from .command import main
 from .constants import (
+    ASSET_MANIFEST_FILENAME, ASSET_MANIFEST_VERSION, ASSET_URL_DIGEST_LENGTH,
     DEFAULT_API_URL, DEFAULT_FILENAMES, DEFAULT_FILENAME, DEFAULT_GRIPHOME,
     DEFAULT_GRIPURL, STYLE_ASSET_URLS_INLINE_FORMAT, STYLE_ASSET_URLS_RE,
     STYLE_ASSET_URLS_SUB_FORMAT, STYLE_URLS_RES, STYLE_URLS_SOURCE,
     SUPPORTED_EXTENSIONS, SUPPORTED_TITLES)
 from .exceptions import AlreadyRunningError, ReadmeNotFoundError
-from .readers import ReadmeReader, DirectoryReader, StdinReader, TextReader
-from .renderers import ReadmeRenderer, GitHubRenderer, OfflineRenderer
+try:
+    from .highlight import HighlightCache
+except ImportError:
+    HighlightCache = None
+from .patcher import Fixup, Patcher, register_fixup
+from .pruning import UsedSelectors, prune_css, prune_unused_styles
+from .ratelimit import RateLimiter, TokenPool
+from .readers import (
+    ReadmeReader, DirectoryReader, InotifyWatcher, PollingWatcher,
+    StdinReader, TextReader, default_watcher)
+from .refresh import RefreshHub, RefreshSubscription
+from .renderers import (
+    ReadmeRenderer, FallbackRenderer, GitHubRenderer, HybridRenderer,
+    IncrementalRenderer, OfflineRenderer, ProcessPoolRenderer,
+    WrappingRenderer)
+from .session import PooledSession
 
 
 __all__ = [
     '__version__',
 
-    'DEFAULT_API_URL', 'DEFAULT_FILENAMES', 'DEFAULT_FILENAME',
-    'DEFAULT_GRIPHOME', 'DEFAULT_GRIPURL', 'STYLE_ASSET_URLS_INLINE_FORMAT',
-    'STYLE_ASSET_URLS_RE', 'STYLE_ASSET_URLS_SUB_FORMAT', 'STYLE_URLS_RES',
-    'STYLE_URLS_SOURCE', 'SUPPORTED_EXTENSIONS', 'SUPPORTED_TITLES',
+    'ASSET_MANIFEST_FILENAME', 'ASSET_MANIFEST_VERSION',
+    'ASSET_URL_DIGEST_LENGTH', 'DEFAULT_API_URL', 'DEFAULT_FILENAMES',
+    'DEFAULT_FILENAME', 'DEFAULT_GRIPHOME', 'DEFAULT_GRIPURL',
+    'STYLE_ASSET_URLS_INLINE_FORMAT', 'STYLE_ASSET_URLS_RE',
+    'STYLE_ASSET_URLS_SUB_FORMAT', 'STYLE_URLS_RES', 'STYLE_URLS_SOURCE',
+    'SUPPORTED_EXTENSIONS', 'SUPPORTED_TITLES',
 
-    'AlreadyRunningError', 'DirectoryReader', 'GitHubAssetManager',
-    'GitHubRenderer', 'Grip', 'OfflineRenderer', 'ReadmeNotFoundError',
-    'ReadmeAssetManager', 'ReadmeReader', 'ReadmeRenderer', 'StdinReader',
-    'TextReader',
+    'AlreadyRunningError', 'CircuitBreaker', 'DirectoryReader',
+    'FallbackRenderer', 'Fixup', 'GitHubAssetManager', 'GitHubRenderer',
+    'Grip', 'HighlightCache', 'HybridRenderer', 'IncrementalRenderer',
+    'InotifyWatcher', 'OfflineRenderer', 'Patcher', 'PollingWatcher',
+    'PooledSession', 'ProcessPoolRenderer', 'RateLimiter',
+    'ReadmeAssetManager', 'ReadmeNotFoundError', 'ReadmeReader',
+    'ReadmeRenderer', 'RefreshHub', 'RefreshSubscription', 'RenderCache',
+    'SingleFlight', 'StdinReader', 'TextReader', 'TokenPool', 'UsedSelectors',
+    'WrappingRenderer',
 
-    'clear_cache', 'create_app', 'export', 'main', 'render_content',
-    'render_page', 'serve',
+    'clear_cache', 'create_app', 'default_watcher', 'export', 'iter_blocks',
+    'main', 'prune_css', 'prune_unused_styles', 'register_fixup',
+    'render_content', 'render_page', 'serve', 'split_blocks',
 ]
@@ -6,6 +6,8 @@ import sys
 import errno
 
 from .app import Grip
+from .pruning import prune_unused_styles
+from .ratelimit import TokenPool
 from .readers import DirectoryReader, StdinReader, TextReader
 from .renderers import GitHubRenderer, OfflineRenderer
 
@@ -13,9 +15,17 @@ from .renderers import GitHubRenderer, OfflineRenderer
 def create_app(path=None, user_content=False, context=None, username=None,
                password=None, render_offline=False, render_wide=False,
                render_inline=False, api_url=None, title=None, text=None,
-               autorefresh=None, quiet=None, theme='light', grip_class=None):
+               autorefresh=None, quiet=None, theme='light', grip_class=None,
+               session=None, tokens=None, render_hybrid=None,
+               render_fallback=None):
     """
     Creates a Grip application with the specified overrides.
+
+    Set session to a requests session to share its connection pool
+    between the renderer and the asset manager. Set tokens to a list of
+    personal access tokens to rotate renders between them. Set
+    render_hybrid to serve a local preview until GitHub's render arrives.
+    Set render_fallback to render offline while the API is unavailable.
     """
     # Customize the app
     if grip_class is None:
@@ -34,16 +44,24 @@ def create_app(path=None, user_content=False, context=None, username=None,
     if render_offline:
         renderer = OfflineRenderer(user_content, context)
     elif user_content or context or api_url:
-        renderer = GitHubRenderer(user_content, context, api_url)
+        renderer = GitHubRenderer(user_content, context, api_url,
+                                  session=session)
     else:
         renderer = None
 
     # Optional basic auth
-    auth = (username, password) if username or password else None
+    if tokens:
+        auth = TokenPool(tokens)
+    elif username or password:
+        auth = (username, password)
+    else:
+        auth = None
 
     # Create the customized app with default asset manager
     return grip_class(source, auth, renderer, None, render_wide,
-                      render_inline, title, autorefresh, quiet, theme)
+                      render_inline, title, autorefresh, quiet, theme,
+                      session=session, render_hybrid=render_hybrid,
+                      render_fallback=render_fallback)
 
 
 def serve(path=None, host=None, port=None, user_content=False, context=None,
@@ -76,10 +94,14 @@ def render_page(path=None, user_content=False, context=None,
                 grip_class=None):
     """
     Renders the specified markup text to an HTML page and returns it.
+
+    Pages aren't rendered offline when the API is unavailable, so an
+    offline render isn't mistaken for GitHub's.
     """
     return create_app(path, user_content, context, username, password,
                       render_offline, render_wide, render_inline, api_url,
-                      title, text, False, quiet, theme, grip_class).render()
+                      title, text, False, quiet, theme, grip_class,
+                      render_fallback=False).render()
 
 
 def render_content(text, user_content=False, context=None, username=None,
@@ -97,9 +119,13 @@ def render_content(text, user_content=False, context=None, username=None,
 def export(path=None, user_content=False, context=None,
            username=None, password=None, render_offline=False,
            render_wide=False, render_inline=True, out_filename=None,
-           api_url=None, title=None, quiet=False, theme='light', grip_class=None):
+           api_url=None, title=None, quiet=False, theme='light', grip_class=None,
+           prune_styles=False):
     """
     Exports the rendered HTML to a file.
+
+    Set prune_styles to drop the inlined style rules and fonts that none
+    of the page's elements can use.
     """
     export_to_stdout = out_filename == '-'
     if out_filename is None:
@@ -116,6 +142,8 @@ def export(path=None, user_content=False, context=None,
     page = render_page(path, user_content, context, username, password,
                        render_offline, render_wide, render_inline, api_url,
                        title, None, quiet, theme, grip_class)
+    if prune_styles:
+        page = prune_unused_styles(page)
 
     if export_to_stdout:
         try:
@@ -1,6 +1,8 @@
 from __future__ import print_function, unicode_literals
 
 import base64
+import calendar
+import hashlib
 import json
 import mimetypes
 import os
@@ -10,12 +12,17 @@ import socket
 import sys
 import threading
 import time
+import uuid
 import errno
 from traceback import format_exc
 try:
     from urlparse import urlparse
 except ImportError:
     from urllib.parse import urlparse
+try:
+    from queue import Empty
+except ImportError:
+    from Queue import Empty
 try:
     str_type = basestring
 except NameError:
@@ -23,17 +30,35 @@ except NameError:
 
 import requests
 from flask import (
-    Flask, Response, abort, redirect, render_template, request,
-    send_from_directory, url_for)
+    Flask, Response, abort, jsonify, make_response, redirect,
+    render_template, request, send_from_directory, stream_with_context,
+    url_for)
 
 from . import __version__
-from .assets import GitHubAssetManager, ReadmeAssetManager
+from ._compat import safe_join
+from .assets import GitHubAssetManager, ReadmeAssetManager, thread_map
 from .browser import start_browser_when_ready
+from .breaker import CircuitBreaker
+from .cache import RenderCache, SingleFlight
+from .compression import (
+    choose_encoding, compress, compress_stream, is_compressible,
+    precompressed_filename, supported_encodings)
 from .constants import (
-    DEFAULT_GRIPHOME, DEFAULT_GRIPURL, STYLE_ASSET_URLS_INLINE_FORMAT)
+    ASSET_URL_DIGEST_LENGTH, DEFAULT_GRIPHOME, DEFAULT_GRIPURL,
+    STYLE_ASSET_URLS_INLINE_FORMAT)
 from .exceptions import AlreadyRunningError, ReadmeNotFoundError
+from .ratelimit import RateLimiter, TokenPool
 from .readers import DirectoryReader
-from .renderers import GitHubRenderer, ReadmeRenderer
+from .refresh import RefreshHub
+from .renderers import (
+    FallbackRenderer, GitHubRenderer, HybridRenderer, IncrementalRenderer,
+    OfflineRenderer, ProcessPoolRenderer, ReadmeRenderer)
+from .session import PooledSession
+
+
+# Inlined styles shared by every app in the process, like when exporting
+# several files in a row
+_inline_styles_cache = RenderCache(max_size=8)
 
 
 class Grip(Flask):
@@ -44,7 +69,8 @@ class Grip(Flask):
     def __init__(self, source=None, auth=None, renderer=None,
                  assets=None, render_wide=None, render_inline=None, title=None,
                  autorefresh=None, quiet=None, theme='light', grip_url=None,
-                 static_url_path=None, instance_path=None, **kwargs):
+                 static_url_path=None, instance_path=None, session=None,
+                 render_hybrid=None, render_fallback=None, **kwargs):
         # Defaults
         if source is None or isinstance(source, str_type):
             source = DirectoryReader(source)
@@ -87,18 +113,37 @@ class Grip(Flask):
             autorefresh = self.config['AUTOREFRESH']
         if quiet is None:
             quiet = self.config['QUIET']
+        if render_hybrid is None:
+            render_hybrid = self.config['RENDER_HYBRID']
+        if render_fallback is None:
+            render_fallback = self.config['RENDER_FALLBACK']
+        stale_while_revalidate = self.config['STALE_WHILE_REVALIDATE']
         if auth is None:
             username = self.config['USERNAME']
             password = self.config['PASSWORD']
-            if username or password:
+            if self.config['TOKENS']:
+                auth = self.config['TOKENS']
+            elif username or password:
                 auth = (username or '', password or '')
+        if isinstance(auth, list):
+            auth = TokenPool(auth)
 
         # Thread-safe event to signal to the polling threads to exit
         self._run_mutex = threading.Lock()
         self._shutdown_event = None
 
+        # Coalesces identical renders from concurrent requests
+        self._render_flights = SingleFlight()
+
+        # Watches each refreshed subpath once for all connected clients
+        self._refresh_hub = RefreshHub(
+            source, self._render_background_content, quiet,
+            debounce=self.config['AUTOREFRESH_DEBOUNCE'],
+            preview=self._render_preview_content)
+
         # Parameterized attributes
         self.auth = auth
+        self.session = session
         self.autorefresh = autorefresh
         self.reader = source
         self.renderer = renderer
@@ -107,6 +152,7 @@ class Grip(Flask):
         self.render_inline = render_inline
         self.title = title
         self.quiet = quiet
+        self.stale_while_revalidate = stale_while_revalidate
         if self.quiet:
             import logging
             log = logging.getLogger('werkzeug')
@@ -114,6 +160,8 @@ class Grip(Flask):
         self.theme = theme
 
         # Overridable attributes
+        if self.session is None:
+            self.session = self.default_session()
         if self.renderer is None:
             renderer = self.default_renderer()
             if not isinstance(renderer, ReadmeRenderer):
@@ -129,6 +177,40 @@ class Grip(Flask):
                     'ReadmeAssetManager instance, got {0}.'.format(
                         type(assets)))
             self.assets = assets
+        # Share a render cache with renderers that support one
+        if getattr(self.renderer, 'cache', False) is None:
+            self.renderer.cache = self.default_render_cache()
+        # Share the HTTP session with components that don't have their own
+        if getattr(self.renderer, 'session', False) is None:
+            self.renderer.session = self.session
+        if getattr(self.renderer, 'rate_limiter', False) is None:
+            self.renderer.rate_limiter = self.default_rate_limiter()
+        # Render offline in worker processes to use every core
+        if (self.config['RENDER_PROCESSES'] and
+                type(self.renderer) is OfflineRenderer):
+            self.renderer = ProcessPoolRenderer(
+                self.renderer.user_content, self.renderer.context,
+                self.config['RENDER_PROCESSES'],
+                self.config['RENDER_MAX_PENDING'])
+        # Render large Readmes block by block
+        if (self.config['RENDER_INCREMENTAL'] and
+                not isinstance(self.renderer, IncrementalRenderer)):
+            self.renderer = IncrementalRenderer(self.renderer)
+        # Render offline while the API is unavailable
+        if (render_fallback and
+                getattr(self.renderer, 'api_url', None) and
+                not isinstance(self.renderer, FallbackRenderer)):
+            self.renderer = FallbackRenderer(
+                self.renderer, breaker=self.default_circuit_breaker())
+        # Preview locally while waiting for the accurate render
+        if render_hybrid and not isinstance(
+                self.renderer, (HybridRenderer, OfflineRenderer)):
+            self.renderer = HybridRenderer(self.renderer)
+
+        # Remembers the last render of each subpath to serve while stale
+        self._last_renders = self.default_render_cache()
+        if getattr(self.assets, 'session', False) is None:
+            self.assets.session = self.session
 
         # Add missing content types
         self.add_content_types()
@@ -139,10 +221,15 @@ class Grip(Flask):
         refresh_route = posixpath.join(grip_url, 'refresh', '')
         refresh_subpath = posixpath.join(refresh_route, '<path:subpath>')
         rate_limit_route = posixpath.join(grip_url, 'rate-limit-preview')
+        rate_limit_status_route = posixpath.join(grip_url, 'rate-limit')
 
         # Initialize views
         self._styles_retrieved = False
+        self._styles_ready = threading.Event()
+        self._styles_lock = threading.Lock()
         self.before_request(self._retrieve_styles)
+        if self.config['COMPRESSION']:
+            self.after_request(self._compress_response)
         self.add_url_rule(asset_route, 'asset', self._render_asset)
         self.add_url_rule(asset_subpath, 'asset', self._render_asset)
         self.add_url_rule('/', 'render', self._render_page)
@@ -151,6 +238,8 @@ class Grip(Flask):
         self.add_url_rule(refresh_subpath, 'refresh', self._render_refresh)
         self.add_url_rule(rate_limit_route, 'rate_limit',
                           self._render_rate_limit_page)
+        self.add_url_rule(rate_limit_status_route, 'rate_limit_status',
+                          self._render_rate_limit_status)
         self.errorhandler(403)(self._render_rate_limit_page)
 
     def _redirect_to_subpath(self, subpath=None):
@@ -162,12 +251,167 @@ class Grip(Flask):
         route = posixpath.normpath('/' + (subpath or '').lstrip('/'))
         return redirect(route)
 
+    def _render_content(self, subpath, text):
+        """
+        Renders the specified Readme text, sharing the result with any
+        concurrent render of the same text for the same subpath.
+        """
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        # Don't make page loads wait on a background render that yields
+        # to them when the rate limit is running low
+        rate_limiter = getattr(self.renderer, 'rate_limiter', None)
+        is_background = bool(rate_limiter and rate_limiter.is_background)
+        content = self._render_flights.do(
+            (subpath, digest, is_background), self.renderer.render, text,
+            self.auth)
+        if self.stale_while_revalidate:
+            self._last_renders.set(self._last_render_key(subpath), content)
+        return content
+
+    def _last_render_key(self, subpath):
+        return self._last_renders.key(
+            'last-render', getattr(self.reader, 'root_directory', None),
+            subpath, type(self.renderer).__name__, self.renderer.user_content,
+            self.renderer.context, __version__)
+
+    def _render_preview_content(self, subpath, text):
+        """
+        Renders a quick preview of the specified Readme text, or returns
+        None if the renderer doesn't support previews.
+        """
+        render_preview = getattr(self.renderer, 'render_preview', None)
+        if render_preview is None:
+            return None
+        return render_preview(text, self.auth)
+
+    def _render_stale_while_revalidate(self, subpath, text):
+        """
+        Starts rendering the specified Readme text in the background and
+        returns the rendered content and whether it's stale.
+
+        If the render doesn't finish within STALE_WHILE_REVALIDATE_WAIT
+        seconds, a preview of the text is returned as stale content if the
+        renderer supports previews, otherwise the last render of the
+        subpath. The fresh content is then sent to the page by the
+        autorefresh stream.
+        """
+        has_preview = hasattr(self.renderer, 'render_preview')
+        stale = None
+        if not has_preview and self.stale_while_revalidate:
+            stale = self._last_renders.get(self._last_render_key(subpath))
+        if stale is None and not has_preview:
+            return self._render_content(subpath, text), False
+
+        result = {}
+        done = threading.Event()
+
+        def revalidate():
+            try:
+                result['content'] = self._render_content(subpath, text)
+            except Exception as ex:
+                result['error'] = ex
+            finally:
+                done.set()
+
+        thread = threading.Thread(target=revalidate)
+        thread.daemon = True
+        thread.start()
+        if not done.wait(self.config['STALE_WHILE_REVALIDATE_WAIT']):
+            if has_preview:
+                return self._render_preview_content(subpath, text), True
+            return stale, True
+        if 'error' in result:
+            raise result['error']
+        return result['content'], False
+
+    def _render_background_content(self, subpath, text):
+        """
+        Renders the specified Readme text as a background render, which
+        yields to page loads when the API rate limit is running low.
+        """
+        rate_limiter = getattr(self.renderer, 'rate_limiter', None)
+        if rate_limiter is None:
+            return self._render_content(subpath, text)
+        with rate_limiter.background():
+            return self._render_content(subpath, text)
+
     def _render_asset(self, subpath):
         """
-        Renders the specified cache file.
+        Renders the specified cache file, or its precompressed variant
+        if the client accepts it.
+
+        Files requested by the version in their URL are checked against
+        the asset manifest and can be cached by browsers indefinitely.
+        """
+        filename = self.assets.cache_filename(subpath)
+        version = request.args.get('v')
+        is_immutable = False
+        if version:
+            digest = self.assets.cached_digest(filename)
+            is_immutable = (digest is not None and
+                            digest[:ASSET_URL_DIGEST_LENGTH] == version)
+
+        encodings = []
+        if self.config['COMPRESSION']:
+            encodings = [
+                encoding for encoding in supported_encodings()
+                if os.path.isfile(safe_join(
+                    self.assets.cache_path,
+                    precompressed_filename(filename, encoding)))]
+        encoding = choose_encoding(request.accept_encodings, encodings)
+        if encoding is None:
+            response = send_from_directory(self.assets.cache_path, filename)
+        else:
+            response = send_from_directory(
+                self.assets.cache_path,
+                precompressed_filename(filename, encoding),
+                mimetype=mimetypes.guess_type(filename)[0])
+            response.content_encoding = encoding
+        if encodings:
+            response.vary.add('Accept-Encoding')
+        if is_immutable:
+            response.headers['Cache-Control'] = (
+                'public, max-age=31536000, immutable')
+        return response
+
+    def _compress_response(self, response):
+        """
+        Compresses the specified response with the best content encoding
+        the client accepts, if it's worth compressing.
+
+        Streamed responses, like large pages and the autorefresh event
+        stream, are compressed chunk by chunk as they're sent.
         """
-        return send_from_directory(
-            self.assets.cache_path, self.assets.cache_filename(subpath))
+        if (response.status_code != 200 or response.direct_passthrough or
+                'Content-Encoding' in response.headers or
+                not is_compressible(response.mimetype)):
+            return response
+        if not response.is_streamed and (
+                response.calculate_content_length() <
+                self.config['COMPRESSION_MIN_SIZE']):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        level = self.config['COMPRESSION_LEVEL']
+        if response.is_streamed:
+            # Still stop the original stream when the client disconnects
+            close = getattr(response.response, 'close', None)
+            if close is not None:
+                response.call_on_close(close)
+            response.response = compress_stream(
+                response.iter_encoded(), encoding, level)
+            response.headers.pop('Content-Length', None)
+        else:
+            response.set_data(compress(response.get_data(), encoding, level))
+        response.content_encoding = encoding
+        # Each encoding is a different representation of the same page
+        etag, is_weak = response.get_etag()
+        if etag and not is_weak:
+            response.set_etag(etag, weak=True)
+        return response
 
     def _render_page(self, subpath=None):
         # Normalize the subpath
@@ -175,20 +419,63 @@ class Grip(Flask):
         if normalized != subpath:
             return self._redirect_to_subpath(normalized)
 
+        # Stream very large Readmes instead of rendering them all at once
+        threshold = self.config['RENDER_STREAM_THRESHOLD']
+        if threshold and hasattr(self.renderer, 'render_stream'):
+            size = self.reader.size(subpath)
+            if (size is not None and size >= threshold and
+                    not self.reader.is_binary(subpath)):
+                # Send no validators, since the status and headers go out
+                # before it's known whether the render will succeed
+                response = self._render_page_stream(subpath)
+                response.cache_control.no_store = True
+                return response
+
+        # Send binary assets straight from disk in chunks, supporting
+        # conditional and range requests
+        root_directory = getattr(self.reader, 'root_directory', None)
+        if root_directory is not None and self.reader.is_binary(subpath):
+            response = send_from_directory(
+                root_directory, subpath,
+                mimetype=self.reader.mimetype_for(subpath), conditional=True)
+            response.cache_control.no_cache = True
+            return response
+
         # Read the Readme text or asset
         try:
             text = self.reader.read(subpath)
         except ReadmeNotFoundError:
             abort(404)
 
+        # Answer conditional requests without rendering unchanged pages
+        is_binary = self.reader.is_binary(subpath)
+        source = text if is_binary else text.encode('utf-8')
+        etag = self._page_etag(
+            subpath, hashlib.sha256(source).hexdigest(), is_binary)
+        not_modified = self._not_modified(subpath, etag)
+        if not_modified is not None:
+            return not_modified
+
         # Return binary asset
-        if self.reader.is_binary(subpath):
+        if is_binary:
             mimetype = self.reader.mimetype_for(subpath)
-            return Response(text, mimetype=mimetype)
+            return self._make_conditional(
+                subpath, Response(text, mimetype=mimetype), etag)
+
+        # Serve the last render or a preview while revalidating when a
+        # server is running to push the fresh content to the page
+        can_serve_stale = (
+            (self.stale_while_revalidate or
+             hasattr(self.renderer, 'render_preview')) and
+            self.autorefresh and self._shutdown_event is not None)
 
         # Render the Readme content
         try:
-            content = self.renderer.render(text, self.auth)
+            if can_serve_stale:
+                content, is_stale = self._render_stale_while_revalidate(
+                    subpath, text)
+            else:
+                content, is_stale = self._render_content(subpath, text), False
         except requests.HTTPError as ex:
             if ex.response.status_code == 403:
                 abort(403)
@@ -203,15 +490,112 @@ class Grip(Flask):
                 abort(500)
             raise
 
+        # Only let browsers reuse pages with the final, accurate content
+        is_fallback = getattr(self.renderer, 'is_fallback', None)
+        page = self._render_page_template(subpath, content, is_stale)
+        if is_stale or (is_fallback is not None and is_fallback(content)):
+            return page
+        return self._make_conditional(subpath, make_response(page), etag)
+
+    def _page_etag(self, subpath, source, is_binary=False):
+        """
+        Returns a validator for the page of the specified subpath, hashed
+        from its source and everything else that goes into the page.
+        """
+        if is_binary:
+            parts = [subpath, source]
+        else:
+            renderer = self.renderer
+            parts = [
+                subpath, source, type(renderer).__name__,
+                renderer.user_content, renderer.context,
+                getattr(renderer, 'api_url', None),
+                getattr(renderer, 'raw', None), self.title, self.theme,
+                self.render_wide, self.render_inline, self.autorefresh,
+                self.assets.style_urls, __version__]
+        data = json.dumps(parts, sort_keys=True).encode('utf-8')
+        return hashlib.sha256(data).hexdigest()
+
+    def _last_modified(self, subpath):
+        last_updated = self.reader.last_updated(subpath)
+        if not isinstance(last_updated, (int, float)):
+            return None
+        return int(last_updated)
+
+    def _not_modified(self, subpath, etag):
+        """
+        Returns a 304 Not Modified response if the request's validators
+        match the specified ETag or the last modification of the subpath,
+        otherwise returns None.
+        """
+        if request.if_none_match:
+            # Compare weakly to match compressed pages too
+            if not request.if_none_match.contains_weak(etag):
+                return None
+        else:
+            last_modified = self._last_modified(subpath)
+            if_modified_since = request.if_modified_since
+            if (last_modified is None or if_modified_since is None or
+                    last_modified > calendar.timegm(
+                        if_modified_since.utctimetuple())):
+                return None
+        return self._make_conditional(
+            subpath, Response(status=304), etag)
+
+    def _make_conditional(self, subpath, response, etag):
+        """
+        Adds the validators of the specified ETag and the last
+        modification of the subpath to the specified response, requiring
+        browsers to revalidate before reusing it.
+        """
+        response.set_etag(etag)
+        last_modified = self._last_modified(subpath)
+        if last_modified is not None:
+            response.last_modified = last_modified
+        response.cache_control.no_cache = True
+        return response
+
+    def _render_page_stream(self, subpath):
+        """
+        Streams the page for the specified subpath, sending the page
+        before and after the content right away and the content in
+        chunks as it's read and rendered.
+        """
+        marker = 'grip-content-{0}'.format(uuid.uuid4().hex)
+        page = self._render_page_template(subpath, marker)
+        head, tail = page.split(marker, 1)
+
+        def gen():
+            yield head
+            try:
+                for chunk in self.renderer.render_stream(
+                        self.reader.iter_lines(subpath)):
+                    yield chunk
+            except Exception as ex:
+                print(' * Error: could not render {0}:'.format(
+                      self.reader.filename_for(subpath)), ex, file=sys.stderr)
+            yield tail
+
+        return Response(stream_with_context(gen()), mimetype='text/html')
+
+    def _render_page_template(self, subpath, content, is_stale=False):
+        """
+        Renders the page for the specified subpath with the specified
+        rendered content.
+        """
         # Inline favicon asset
         favicon = None
         if self.render_inline:
             favicon_url = url_for('static', filename='favicon.ico')
             favicon = self._to_data_url(favicon_url, 'image/x-icon')
 
-        autorefresh_url = (url_for('refresh', subpath=subpath)
-                           if self.autorefresh
-                           else None)
+        if not self.autorefresh:
+            autorefresh_url = None
+        elif is_stale:
+            autorefresh_url = url_for(
+                'refresh', subpath=subpath, revalidate=1)
+        else:
+            autorefresh_url = url_for('refresh', subpath=subpath)
 
         if self.theme == 'dark':
             data_color_mode = 'dark'
@@ -228,8 +612,8 @@ class Grip(Flask):
             user_content=self.renderer.user_content,
             wide_style=self.render_wide, style_urls=self.assets.style_urls,
             styles=self.assets.styles, autorefresh_url=autorefresh_url,
-            data_color_mode=data_color_mode, data_light_theme=data_light_theme,
-            data_dark_theme=data_dark_theme)
+            stale=is_stale, data_color_mode=data_color_mode,
+            data_light_theme=data_light_theme, data_dark_theme=data_dark_theme)
 
     def _render_refresh(self, subpath=None):
         if not self.autorefresh:
@@ -240,51 +624,48 @@ class Grip(Flask):
         if normalized != subpath:
             return self._redirect_to_subpath(normalized)
 
-        # Get the full filename for display
-        filename = self.reader.filename_for(subpath)
-
         # Check whether app is running
         shutdown_event = self._shutdown_event
         if not shutdown_event or shutdown_event.is_set():
             return ''
 
+        # Whether the page was served stale content and needs the fresh one
+        revalidate = request.args.get('revalidate') == '1'
+
         def gen():
-            last_updated = self.reader.last_updated(subpath)
+            subscription = self._refresh_hub.subscribe(subpath, shutdown_event)
+            last_sent = time.time()
             try:
-                while not shutdown_event.is_set():
-                    time.sleep(0.3)
-
-                    # Check for update
-                    updated = self.reader.last_updated(subpath)
-                    if updated == last_updated:
-                        continue
-                    last_updated = updated
-                    # Notify user that a refresh is in progress
-                    if not self.quiet:
-                        print(' * Change detected in {0}, refreshing'
-                              .format(filename))
-                    yield 'data: {0}\r\n\r\n'.format(
-                        json.dumps({'updating': True}))
-                    # Binary assets not supported
-                    if self.reader.is_binary(subpath):
-                        return
-                    # Read the Readme text
+                if revalidate:
+                    # Join the render started by the page or render again
                     try:
                         text = self.reader.read(subpath)
-                    except ReadmeNotFoundError:
-                        return
-                    # Render the Readme content
+                        content = self._render_content(subpath, text)
+                    except Exception as ex:
+                        print(' * Error: could not revalidate content:', ex,
+                              file=sys.stderr)
+                    else:
+                        last_sent = time.time()
+                        yield 'data: {0}\r\n\r\n'.format(
+                            json.dumps({'content': content}))
+                while not shutdown_event.is_set():
                     try:
-                        content = self.renderer.render(text, self.auth)
-                    except requests.HTTPError as ex:
-                        if ex.response.status_code == 403:
-                            abort(403)
-                        raise
-                    # Return the Readme content
-                    yield 'data: {0}\r\n\r\n'.format(
-                        json.dumps({'content': content}))
+                        event = subscription.get(timeout=0.3)
+                    except Empty:
+                        # Periodically write to detect disconnected clients
+                        if time.time() - last_sent >= 15:
+                            last_sent = time.time()
+                            yield ': keep-alive\r\n\r\n'
+                        continue
+                    # Stop when the watcher has no more updates
+                    if event is None:
+                        return
+                    last_sent = time.time()
+                    yield 'data: {0}\r\n\r\n'.format(json.dumps(event))
             except GeneratorExit:
                 pass
+            finally:
+                self._refresh_hub.unsubscribe(subscription)
 
         return Response(gen(), mimetype='text/event-stream')
 
@@ -296,16 +677,27 @@ class Grip(Flask):
         is_auth = auth == '1' if auth else bool(self.auth)
         return render_template('limit.html', is_authenticated=is_auth), 403
 
+    def _render_rate_limit_status(self):
+        """
+        Renders the current API rate limit budget as JSON.
+        """
+        rate_limiter = getattr(self.renderer, 'rate_limiter', None)
+        if rate_limiter is None:
+            abort(404)
+        status = rate_limiter.status()
+        if isinstance(self.auth, TokenPool):
+            status['credentials'] = self.auth.status()
+        return jsonify(status)
+
     def _download(self, url, binary=False):
         if urlparse(url).netloc:
-            r = requests.get(url)
+            r = self.session.get(url)
             return r.content if binary else r.text
 
         with self.test_client() as c:
-            r = c.get(url)
+            r = c.get(url, environ_base={'grip.inline_styles': True})
             charset = r.mimetype_params.get('charset', 'utf-8')
-            data = c.get(url).data
-            return data if binary else data.decode(charset)
+            return r.data if binary else r.data.decode(charset)
 
     def _to_data_url(self, url, content_type):
         asset = self._download(url, binary=True)
@@ -313,55 +705,151 @@ class Grip(Flask):
         asset64_string = asset64_bytes.decode('ascii')
         return 'data:{0};base64,{1}'.format(content_type, asset64_string)
 
-    def _match_asset(self, match):
-        url = match.group(1)
-        ext = os.path.splitext(url)[1][1:]
-        return 'url({0})'.format(
-            self._to_data_url(url, 'font/' + ext))
+    def _asset_data_url(self, url):
+        path = urlparse(url).path
+        ext = os.path.splitext(path)[1][1:]
+        return self._to_data_url(url, 'font/' + ext)
 
     def _get_styles(self, style_urls, asset_url_path):
         """
         Gets the content of the given list of style URLs and
         inlines assets.
+
+        Styles, and then their assets, are downloaded concurrently, and
+        assets shared by several styles are only downloaded once.
         """
-        styles = []
-        for style_url in style_urls:
-            urls_inline = STYLE_ASSET_URLS_INLINE_FORMAT.format(
-                asset_url_path.rstrip('/'))
-            asset_content = self._download(style_url)
-            content = re.sub(urls_inline, self._match_asset, asset_content)
-            styles.append(content)
+        urls_inline = STYLE_ASSET_URLS_INLINE_FORMAT.format(
+            asset_url_path.rstrip('/'))
+        max_workers = self.config['ASSET_WORKERS']
+        contents = thread_map(self._download, style_urls, max_workers)
 
-        return styles
+        asset_urls = []
+        for content in contents:
+            asset_urls.extend(url for url in re.findall(urls_inline, content)
+                              if url not in asset_urls)
+        data_urls = dict(zip(asset_urls, thread_map(
+            self._asset_data_url, asset_urls, max_workers)))
+
+        return [re.sub(urls_inline,
+                       lambda match: 'url({0})'.format(
+                           data_urls[match.group(1)]),
+                       content)
+                for content in contents]
+
+    def _inline_styles_key(self, style_urls, asset_url_path):
+        """
+        Returns the key of the inlined styles for the specified style
+        URLs and whether it's derived from the hashes of cached styles,
+        so the inlined styles can be kept in the asset cache.
+        """
+        digests = []
+        for url in style_urls:
+            digest = None
+            if url.startswith(asset_url_path):
+                digest = self.assets.cached_digest(
+                    self.assets.cache_filename(url))
+            digests.append(digest)
+        is_hashed = (bool(style_urls) and None not in digests and
+                     bool(self.assets.cache_path))
+        key = _inline_styles_cache.key(
+            'inline-styles', style_urls, digests, asset_url_path,
+            __version__)
+        return key, is_hashed
 
     def _inline_styles(self):
         """
         Downloads the assets from the style URL list, clears it, and adds
         each style with its embedded asset to the literal style list.
+
+        The inlined styles are kept in memory for every app in the process
+        and, when they're built from the asset cache, in the asset cache
+        for later runs.
         """
-        styles = self._get_styles(self.assets.style_urls, url_for('asset'))
+        asset_url_path = url_for('asset')
+        style_urls = list(self.assets.style_urls)
+        key, is_hashed = self._inline_styles_key(style_urls, asset_url_path)
+        asset_cache = (RenderCache(self.assets.cache_path, 1)
+                       if is_hashed else None)
+
+        data = _inline_styles_cache.get(key)
+        if data is None and asset_cache is not None:
+            data = asset_cache.get(key)
+            if data is not None:
+                _inline_styles_cache.set(key, data)
+        if data is not None:
+            styles = json.loads(data)
+        else:
+            styles = self._get_styles(style_urls, asset_url_path)
+            data = json.dumps(styles)
+            _inline_styles_cache.set(key, data)
+            if asset_cache is not None:
+                asset_cache.set(key, data)
+
         self.assets.styles.extend(styles)
         self.assets.style_urls[:] = []
 
     def _retrieve_styles(self):
         """
         Retrieves the style URLs from the source and caches them. This
-        is called before the first request is dispatched.
+        is called before each request is dispatched, which waits for
+        the styles if they're being retrieved on another thread.
         """
-        if self._styles_retrieved:
+        if self._styles_ready.is_set():
+            return
+        with self._styles_lock:
+            is_retrieving = self._styles_retrieved
+            self._styles_retrieved = True
+        if is_retrieving:
+            # Requests made while inlining the styles don't wait for them
+            if not request.environ.get('grip.inline_styles'):
+                self._styles_ready.wait()
             return
-        self._styles_retrieved = True
 
         try:
-            self.assets.retrieve_styles(url_for('asset'))
-        except Exception as ex:
-            if self.debug:
-                print(format_exc(), file=sys.stderr)
-            else:
+            try:
+                self.assets.retrieve_styles(url_for('asset'))
+            except Exception as ex:
+                if self.debug:
+                    print(format_exc(), file=sys.stderr)
+                else:
+                    print(' * Error: could not retrieve styles:', ex,
+                          file=sys.stderr)
+            if self.render_inline:
+                self._inline_styles()
+        finally:
+            self._styles_ready.set()
+
+    @property
+    def styles_ready(self):
+        """
+        Whether the styles have been retrieved, and inlined when
+        rendering inline, so pages can be served without waiting.
+        """
+        return self._styles_ready.is_set()
+
+    def retrieve_styles_in_background(self):
+        """
+        Starts retrieving the styles on a background thread, so the first
+        request doesn't have to wait for them if they're ready by then.
+
+        Returns the thread, or None if the styles were already retrieved
+        or are being retrieved.
+        """
+        if self._styles_retrieved:
+            return None
+
+        def retrieve():
+            try:
+                with self.test_request_context():
+                    self._retrieve_styles()
+            except Exception as ex:
                 print(' * Error: could not retrieve styles:', ex,
                       file=sys.stderr)
-        if self.render_inline:
-            self._inline_styles()
+
+        thread = threading.Thread(target=retrieve)
+        thread.daemon = True
+        thread.start()
+        return thread
 
     def default_renderer(self):
         """
@@ -369,7 +857,10 @@ class Grip(Flask):
 
         This is only used if renderer is set to None in the constructor.
         """
-        return GitHubRenderer(api_url=self.config['API_URL'])
+        return GitHubRenderer(api_url=self.config['API_URL'],
+                              cache=self.default_render_cache(),
+                              session=self.session,
+                              rate_limiter=self.default_rate_limiter())
 
     def default_asset_manager(self):
         """
@@ -383,7 +874,58 @@ class Grip(Flask):
             cache_directory = cache_directory.format(version=__version__)
             cache_path = os.path.join(self.instance_path, cache_directory)
         return GitHubAssetManager(
-            cache_path, self.config['STYLE_URLS'], self.quiet)
+            cache_path, self.config['STYLE_URLS'], self.quiet, self.session,
+            self.config['COMPRESSION'], self.config['ASSET_WORKERS'])
+
+    def default_rate_limiter(self):
+        """
+        Returns the default API rate limiter using the current config.
+
+        This is used by renderers that support rate limiting but were not
+        given a rate limiter of their own.
+        """
+        return RateLimiter(
+            self.config['RATE_LIMIT_RESERVE'], self.config['RATE_LIMIT_BURST'],
+            self.config['RATE_LIMIT_BACKOFF'],
+            self.config['RATE_LIMIT_MAX_BACKOFF'],
+            self.config['RATE_LIMIT_MAX_RETRIES'])
+
+    def default_circuit_breaker(self):
+        """
+        Returns the default circuit breaker for API renders using the
+        current config.
+
+        This is used when falling back to offline rendering while the
+        API is unavailable.
+        """
+        return CircuitBreaker(
+            self.config['CIRCUIT_BREAKER_MAX_FAILURES'],
+            self.config['CIRCUIT_BREAKER_RESET_TIMEOUT'])
+
+    def default_session(self):
+        """
+        Returns the default HTTP session using the current config.
+
+        This is only used if session is set to None in the constructor.
+        """
+        return PooledSession(
+            self.config['HTTP_POOL_SIZE'], self.config['HTTP_RETRIES'],
+            self.config['HTTP_TIMEOUT'])
+
+    def default_render_cache(self):
+        """
+        Returns the default render cache using the current config.
+
+        This is used by renderers that support caching but were not
+        given a cache of their own.
+        """
+        cache_path = None
+        cache_directory = self.config['RENDER_CACHE_DIRECTORY']
+        if cache_directory:
+            cache_directory = cache_directory.format(version=__version__)
+            cache_path = os.path.join(self.instance_path, cache_directory)
+        return RenderCache(cache_path, self.config['RENDER_CACHE_SIZE'],
+                           self.config['RENDER_CACHE_DISK_SIZE'])
 
     def add_content_types(self):
         """
@@ -397,6 +939,9 @@ class Grip(Flask):
 
     def clear_cache(self):
         self.assets.clear()
+        _inline_styles_cache.clear()
+        if getattr(self.renderer, 'cache', None) is not None:
+            self.renderer.cache.clear()
         if not self.quiet:
             print('Cache cleared.')
 
@@ -439,10 +984,20 @@ class Grip(Flask):
                 auth_method = ('credentials: {0}'.format(username)
                                if username
                                else 'personal access token')
+            elif isinstance(self.auth, TokenPool):
+                auth_method = 'pool of {0} credentials'.format(len(self.auth))
             else:
                 auth_method = type(self.auth).__name__
             print(' * Using', auth_method, file=sys.stderr)
 
+        # Start the renderer's workers and retrieve the styles while the
+        # server starts, only in the process that serves requests when
+        # reloading. Workers are started first so they aren't forked
+        # while the styles thread is running.
+        if not use_reloader or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            self.renderer.start()
+            self.retrieve_styles_in_background()
+
         # Get random port manually when needed ahead of time
         if port == 0 and open_browser:
             sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -471,3 +1026,4 @@ class Grip(Flask):
 
         # Cleanup
         self._shutdown_event = None
+        self.renderer.close()
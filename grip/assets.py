@@ -1,27 +1,51 @@
 from __future__ import print_function, unicode_literals
 
 import errno
+import hashlib
+import io
+import json
 import os
 import posixpath
 import re
 import sys
 import shutil
+import tempfile
+import threading
 from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
 try:
     from urlparse import urljoin
 except ImportError:
     from urllib.parse import urljoin
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
 
 import requests
 
 from ._compat import safe_join
+from .compression import precompress, precompressed_filename
 
 from .constants import (
+    ASSET_MANIFEST_FILENAME, ASSET_MANIFEST_VERSION, ASSET_URL_DIGEST_LENGTH,
     STYLE_URLS_SOURCE, STYLE_URLS_RES, STYLE_ASSET_URLS_RE,
     STYLE_ASSET_URLS_SUB_FORMAT)
 from .vendor.six import add_metaclass
 
 
+def thread_map(func, items, max_workers):
+    """
+    Calls the specified function with each item in a pool of up to
+    max_workers threads, returning the results in order.
+    """
+    items = list(items)
+    if ThreadPoolExecutor is None or max_workers <= 1 or len(items) <= 1:
+        return list(map(func, items))
+    with ThreadPoolExecutor(min(max_workers, len(items))) as pool:
+        return list(pool.map(func, items))
+
+
 @add_metaclass(ABCMeta)
 class ReadmeAssetManager(object):
     """
@@ -54,6 +78,13 @@ class ReadmeAssetManager(object):
         url = posixpath.basename(url)
         return self._strip_url_params(url)
 
+    def cached_digest(self, filename):
+        """
+        Gets the SHA-256 hex digest of the specified cached file, or None
+        if it's not known or the file doesn't match it.
+        """
+        return None
+
     @abstractmethod
     def retrieve_styles(self, asset_url_path):
         """
@@ -67,10 +98,28 @@ class GitHubAssetManager(ReadmeAssetManager):
     """
     Reads the styles used for rendering Readme pages.
 
-    Set cache_path to None to disable caching.
+    Set cache_path to None to disable caching. Set session to a requests
+    session to reuse its connections for all downloads, which run in up
+    to max_workers threads. Set precompress to False to skip storing
+    compressed variants of the cached styles.
     """
-    def __init__(self, cache_path, style_urls=None, quiet=None):
+    def __init__(self, cache_path, style_urls=None, quiet=None,
+                 session=None, precompress=None, max_workers=None):
+        if precompress is None:
+            precompress = True
+        if max_workers is None:
+            max_workers = 8
         super(GitHubAssetManager, self).__init__(cache_path, style_urls, quiet)
+        self.session = session
+        self.precompress = precompress
+        self.max_workers = max_workers
+        self._manifest = None
+        self._verified = {}
+        self._lock = threading.Lock()
+
+    def _get(self, url, **kwargs):
+        session = self.session if self.session is not None else requests
+        return session.get(url, **kwargs)
 
     def _get_style_urls(self, asset_url_path):
         """
@@ -85,7 +134,7 @@ class GitHubAssetManager(ReadmeAssetManager):
                 return cached
 
         # Find style URLs
-        r = requests.get(STYLE_URLS_SOURCE)
+        r = self._get(STYLE_URLS_SOURCE)
         if not 200 <= r.status_code < 300:
             print('Warning: retrieving styles gave status code',
                   r.status_code, file=sys.stderr)
@@ -108,83 +157,237 @@ class GitHubAssetManager(ReadmeAssetManager):
 
     def _get_cached_style_urls(self, asset_url_path):
         """
-        Gets the URLs of the cached styles.
+        Gets the URLs of the cached styles, or an empty list if the cache
+        is missing or incomplete.
+
+        Each URL carries the hash of its file, so it can be cached by
+        browsers for as long as the file exists.
+        """
+        manifest = self._read_manifest()
+        if manifest is None:
+            return []
+        return [self._versioned_url(asset_url_path, style, manifest)
+                for style in manifest['styles']]
+
+    def _versioned_url(self, asset_url_path, relname, manifest):
+        digest = manifest['files'][relname]['sha256']
+        return '{0}?v={1}'.format(
+            posixpath.join(asset_url_path, relname),
+            digest[:ASSET_URL_DIGEST_LENGTH])
+
+    def _read_manifest(self):
+        """
+        Reads the manifest of the cached files, which is only written once
+        every file is cached, and keeps it for later calls.
         """
+        if self._manifest is not None:
+            return self._manifest
         try:
-            cached_styles = os.listdir(self.cache_path)
-        except IOError as ex:
-            if ex.errno != errno.ENOENT and ex.errno != errno.ESRCH:
+            with io.open(safe_join(self.cache_path, ASSET_MANIFEST_FILENAME),
+                         'rt', encoding='utf-8') as f:
+                manifest = json.load(f)
+        # OSError for Python 3 base class, EnvironmentError for Python 2
+        except (OSError, EnvironmentError) as ex:
+            if ex.errno not in (errno.ENOENT, errno.ESRCH, errno.ENOTDIR):
                 raise
-            return []
-        except OSError:
-            return []
-        return [posixpath.join(asset_url_path, style)
-                for style in cached_styles
-                if style.endswith('.css')]
+            return None
+        except ValueError:
+            return None
+        # Download again after upgrading from an older manifest
+        if manifest.get('version') != ASSET_MANIFEST_VERSION:
+            return None
+        self._manifest = manifest
+        return manifest
+
+    def cached_digest(self, filename):
+        """
+        Gets the SHA-256 hex digest of the specified cached file, or None
+        if it's not in the manifest or the file doesn't match it.
+
+        Each file is checked against the manifest the first time it's
+        requested. A cache with a mismatched file is downloaded again the
+        next time styles are retrieved.
+        """
+        manifest = self._read_manifest() if self.cache_path else None
+        entry = manifest['files'].get(filename) if manifest else None
+        if entry is None:
+            return None
+        with self._lock:
+            is_valid = self._verified.get(filename)
+        if is_valid is None:
+            is_valid = self._verify(filename, entry)
+            with self._lock:
+                self._verified[filename] = is_valid
+            if not is_valid:
+                print(' * Warning: Cached asset', filename,
+                      'does not match the manifest, downloading again',
+                      file=sys.stderr)
+                self._invalidate()
+        return entry['sha256'] if is_valid else None
+
+    def _verify(self, filename, entry):
+        try:
+            with open(safe_join(self.cache_path, filename), 'rb') as f:
+                data = f.read()
+        # OSError for Python 3 base class, EnvironmentError for Python 2
+        except (OSError, EnvironmentError):
+            return False
+        return (len(data) == entry['size'] and
+                hashlib.sha256(data).hexdigest() == entry['sha256'])
+
+    def _invalidate(self):
+        """
+        Removes the manifest so the cache is considered incomplete.
+        """
+        self._manifest = None
+        try:
+            os.remove(safe_join(self.cache_path, ASSET_MANIFEST_FILENAME))
+        except OSError as ex:
+            if ex.errno != errno.ENOENT:
+                raise
+
+    def clear(self):
+        """
+        Clears the asset cache.
+        """
+        super(GitHubAssetManager, self).clear()
+        self._manifest = None
+        with self._lock:
+            self._verified.clear()
+
+    def _write_file(self, relname, data):
+        """
+        Writes the specified file to the cache through a temporary file,
+        so readers never see a partial file.
+        """
+        filename = safe_join(self.cache_path, relname)
+        fd, temp_filename = tempfile.mkstemp(dir=self.cache_path)
+        try:
+            with io.open(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_filename, filename)
+        except BaseException:
+            os.remove(temp_filename)
+            raise
+        return filename
+
+    def _map(self, func, items):
+        return thread_map(func, items, self.max_workers)
+
+    def _download_style(self, style_url):
+        """
+        Downloads the specified style.
+
+        Returns the contents and the URLs of its assets, or None if the
+        download failed.
+        """
+        if not self.quiet:
+            print(' * Downloading style', style_url, file=sys.stderr)
+        r = self._get(style_url)
+        if not 200 <= r.status_code < 300:
+            print(' -> Warning: Style request responded with',
+                  r.status_code, file=sys.stderr)
+            return None
+        asset_content = r.text
+        asset_urls = [
+            urljoin(style_url, url)
+            for url in re.findall(STYLE_ASSET_URLS_RE, asset_content)]
+        return asset_content, asset_urls
+
+    def _download_asset(self, asset_url):
+        """
+        Downloads the specified binary asset, returning its contents or
+        None if the download failed.
+        """
+        if not self.quiet:
+            print(' * Downloading asset', asset_url, file=sys.stderr)
+        r = self._get(asset_url, stream=True)
+        if not 200 <= r.status_code < 300:
+            print(' -> Warning: Asset request responded with',
+                  r.status_code, file=sys.stderr)
+            return None
+        return r.raw.read(decode_content=True)
 
     def _cache_contents(self, style_urls, asset_url_path):
         """
         Fetches the given URLs and caches their contents
         and their assets in the given directory.
+
+        Downloads run concurrently, and the manifest is written after
+        every file, so an interrupted download is retried next time.
         """
-        files = {}
+        style_urls = list(OrderedDict.fromkeys(style_urls))
+        styles = self._map(self._download_style, style_urls)
+        # Skip caching if something went wrong to try again next time
+        if not styles or None in styles:
+            return False
 
         asset_urls = []
-        for style_url in style_urls:
-            if not self.quiet:
-                print(' * Downloading style', style_url, file=sys.stderr)
-            r = requests.get(style_url)
-            if not 200 <= r.status_code < 300:
-                print(' -> Warning: Style request responded with',
-                      r.status_code, file=sys.stderr)
-                files = None
-                continue
-            asset_content = r.text
-            # Find assets and replace their base URLs with the cache directory
-            for url in re.findall(STYLE_ASSET_URLS_RE, asset_content):
-                asset_urls.append(urljoin(style_url, url))
-            contents = re.sub(
-                STYLE_ASSET_URLS_RE,
-                STYLE_ASSET_URLS_SUB_FORMAT.format(asset_url_path.rstrip('/')),
-                asset_content)
-            # Prepare cache
-            if files is not None:
-                filename = self.cache_filename(style_url)
-                files[filename] = contents.encode('utf-8')
-
-        for asset_url in asset_urls:
-            if not self.quiet:
-                print(' * Downloading asset', asset_url, file=sys.stderr)
-            # Retrieve binary file and show message
-            r = requests.get(asset_url, stream=True)
-            if not 200 <= r.status_code < 300:
-                print(' -> Warning: Asset request responded with',
-                      r.status_code, file=sys.stderr)
-                files = None
-                continue
-            # Prepare cache
-            if files is not None:
-                filename = self.cache_filename(asset_url)
-                files[filename] = r.raw.read(decode_content=True)
-
-        # Skip caching if something went wrong to try again next time
-        if not files:
+        for _, urls in styles:
+            asset_urls.extend(url for url in urls if url not in asset_urls)
+        assets = self._map(self._download_asset, asset_urls)
+        if None in assets:
             return False
 
-        # Cache files if all downloads were successful
-        cache = {}
+        # Hash the assets first to point the styles to their versions
+        manifest = {
+            'version': ASSET_MANIFEST_VERSION,
+            'styles': [self.cache_filename(url) for url in style_urls],
+            'files': OrderedDict(),
+        }
+        files = OrderedDict()
+        for url, contents in zip(asset_urls, assets):
+            files[self.cache_filename(url)] = (url, contents)
+
+        def replace_asset_url(match):
+            # Replace the base URL with the versioned cached asset
+            entry = manifest['files'][self.cache_filename(match.group(1))]
+            return match.expand(STYLE_ASSET_URLS_SUB_FORMAT.format(
+                asset_url_path.rstrip('/'),
+                entry['sha256'][:ASSET_URL_DIGEST_LENGTH]))
+
         for relname in files:
-            cache[safe_join(self.cache_path, relname)] = files[relname]
+            url, contents = files[relname]
+            manifest['files'][relname] = self._manifest_entry(url, contents)
+        for style_url, (content, _) in zip(style_urls, styles):
+            contents = re.sub(
+                STYLE_ASSET_URLS_RE, replace_asset_url, content).encode(
+                    'utf-8')
+            relname = self.cache_filename(style_url)
+            files[relname] = (style_url, contents)
+            manifest['files'][relname] = self._manifest_entry(
+                style_url, contents)
+
+        # Cache files if all downloads were successful
         if not os.path.exists(self.cache_path):
             os.makedirs(self.cache_path)
-        for filename in cache:
-            with open(filename, 'wb') as f:
-                f.write(cache[filename])
+        for relname in files:
+            contents = files[relname][1]
+            # Compress styles once here instead of on every request
+            if self.precompress:
+                variants = precompress(relname, contents)
+                for encoding, compressed in variants.items():
+                    self._write_file(
+                        precompressed_filename(relname, encoding), compressed)
+            self._write_file(relname, contents)
+        self._write_file(
+            ASSET_MANIFEST_FILENAME,
+            json.dumps(manifest, indent=2).encode('utf-8'))
+        self._manifest = manifest
+        with self._lock:
+            self._verified.clear()
         if not self.quiet:
             print(
                 ' * Cached all downloads in', self.cache_path, file=sys.stderr)
         return True
 
+    def _manifest_entry(self, url, contents):
+        return OrderedDict([
+            ('url', url),
+            ('size', len(contents)),
+            ('sha256', hashlib.sha256(contents).hexdigest()),
+        ])
+
     def retrieve_styles(self, asset_url_path):
         """
         Get style URLs from the source HTML page and specified cached
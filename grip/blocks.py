@@ -0,0 +1,101 @@
+from __future__ import print_function, unicode_literals
+
+import re
+
+
+FENCE_RE = re.compile(r'^ {0,3}(`{3,}|~{3,})')
+LIST_ITEM_RE = re.compile(r'^ {0,3}(?:[*+-]|\d{1,9}[.)])(?:[ \t]|$)')
+REFERENCE_DEFINITION_RE = re.compile(r'^ {0,3}\[(?!\^)[^\]]+\]:[ \t]*(\S)?')
+
+
+def iter_blocks(lines):
+    """
+    Splits the specified Markdown lines into top-level blocks, yielding
+    ('block', text) for content and ('definition', text) for reference
+    link definitions, which apply to the whole document.
+
+    Fenced code is never split, and lists and indented content stay in
+    one block across blank lines, as do definitions and their indented
+    continuation lines, like a title. Since lines can be any iterable,
+    this can split a document while it's being read.
+    """
+    block = []
+    definition = None
+    needs_destination = False
+    fence = None
+    is_list = False
+    after_blank = False
+
+    for line in lines:
+        line = line.rstrip('\r\n')
+
+        # Keep a definition's destination or title on the following lines
+        if definition is not None:
+            if line.strip() and (needs_destination or line[:1] in ' \t'):
+                definition.append(line)
+                needs_destination = False
+                continue
+            yield 'definition', '\n'.join(definition)
+            definition = None
+
+        # Keep fenced code together, blank lines included
+        if fence:
+            block.append(line)
+            match = FENCE_RE.match(line)
+            if (match and match.group(1)[0] == fence[0] and
+                    len(match.group(1)) >= len(fence) and
+                    not line.strip().lstrip(fence[0])):
+                fence = None
+            continue
+
+        if not line.strip():
+            if block:
+                after_blank = True
+                block.append(line)
+            continue
+
+        is_indented = line[:1] in (' ', '\t') and not (
+            FENCE_RE.match(line) or LIST_ITEM_RE.match(line) or
+            REFERENCE_DEFINITION_RE.match(line))
+        is_list_item = bool(LIST_ITEM_RE.match(line))
+
+        # Start a new block after a blank line unless this continues it
+        if after_blank and not is_indented and not (is_list and is_list_item):
+            yield 'block', '\n'.join(block).strip('\n')
+            block = []
+            is_list = False
+        after_blank = False
+
+        if not block:
+            match = REFERENCE_DEFINITION_RE.match(line)
+            if match:
+                definition = [line]
+                needs_destination = match.group(1) is None
+                continue
+
+        if not block:
+            is_list = is_list_item
+        block.append(line)
+        match = FENCE_RE.match(line)
+        if match:
+            fence = match.group(1)
+
+    if definition is not None:
+        yield 'definition', '\n'.join(definition)
+    if block:
+        yield 'block', '\n'.join(block).strip('\n')
+
+
+def split_blocks(text):
+    """
+    Splits the specified Markdown text into a list of top-level blocks
+    and a list of reference link definitions.
+    """
+    blocks = []
+    definitions = []
+    for kind, block in iter_blocks(text.splitlines()):
+        if kind == 'definition':
+            definitions.append(block)
+        else:
+            blocks.append(block)
+    return blocks, definitions
@@ -0,0 +1,95 @@
+from __future__ import print_function, unicode_literals
+
+import threading
+import time
+
+
+class CircuitBreaker(object):
+    """
+    Stops calling an unhealthy upstream after repeated failures.
+
+    The breaker starts closed and lets every call through. After
+    max_failures consecutive failures it opens and rejects calls for
+    reset_timeout seconds, after which it's half-open and lets a single
+    probe call through. A successful probe closes the breaker again and
+    a failed one opens it for another reset_timeout seconds.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, max_failures=None, reset_timeout=None):
+        if max_failures is None:
+            max_failures = 3
+        if reset_timeout is None:
+            reset_timeout = 30.0
+        super(CircuitBreaker, self).__init__()
+        self.max_failures = max_failures
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _state(self, now):
+        if self.opened_at is None:
+            return self.CLOSED
+        if now - self.opened_at < self.reset_timeout:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    @property
+    def state(self):
+        """
+        The current state: CLOSED, OPEN, or HALF_OPEN.
+        """
+        with self._lock:
+            return self._state(time.time())
+
+    def allow(self):
+        """
+        Returns whether a call may be sent upstream now. When half-open,
+        this only returns True for one probe call at a time.
+        """
+        with self._lock:
+            state = self._state(time.time())
+            if state == self.CLOSED:
+                return True
+            if state == self.OPEN or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        """
+        Records a successful call, closing the breaker.
+        """
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        """
+        Records a failed call, opening the breaker after max_failures
+        consecutive failures or when a probe call fails.
+        """
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.max_failures:
+                self.opened_at = time.time()
+            self._probing = False
+
+    def status(self):
+        """
+        Returns a dict describing the current state of the breaker.
+        """
+        with self._lock:
+            now = time.time()
+            state = self._state(now)
+            return {
+                'state': state,
+                'failures': self.failures,
+                'retry_in': (max(self.opened_at + self.reset_timeout - now, 0)
+                             if state == self.OPEN else 0),
+            }
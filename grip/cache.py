@@ -0,0 +1,190 @@
+from __future__ import print_function, unicode_literals
+
+import errno
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+class RenderCache(object):
+    """
+    Caches rendered Readme content by a hash of everything that went
+    into rendering it.
+
+    Entries are kept in a bounded in-memory LRU and, if cache_path is
+    set, are also persisted to disk so they survive a server restart.
+    Set cache_path to None to only cache in memory. Up to max_disk_size
+    entries are kept on disk, removing the least recently used first.
+    """
+    def __init__(self, cache_path=None, max_size=None, max_disk_size=None):
+        if max_size is None:
+            max_size = 128
+        if max_disk_size is None:
+            max_disk_size = 1024
+        super(RenderCache, self).__init__()
+        self.cache_path = cache_path
+        self.max_size = max_size
+        self.max_disk_size = max_disk_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _filename_for(self, key):
+        return os.path.join(self.cache_path, key + '.html')
+
+    def _read(self, key):
+        filename = self._filename_for(key)
+        try:
+            with io.open(filename, 'rt', encoding='utf-8') as f:
+                content = f.read()
+            # Mark the entry as recently used so it's pruned last
+            os.utime(filename, None)
+            return content
+        # OSError for Python 3 base class, EnvironmentError for Python 2
+        except (OSError, EnvironmentError) as ex:
+            if ex.errno == errno.ENOENT:
+                return None
+            raise
+
+    def _write(self, key, content):
+        if not os.path.exists(self.cache_path):
+            try:
+                os.makedirs(self.cache_path)
+            except OSError as ex:
+                if ex.errno != errno.EEXIST:
+                    raise
+        # Write to a temporary file first so readers never see a partial file
+        fd, temp_filename = tempfile.mkstemp(dir=self.cache_path)
+        try:
+            with io.open(fd, 'wt', encoding='utf-8') as f:
+                f.write(content)
+            os.replace(temp_filename, self._filename_for(key))
+        except BaseException:
+            os.remove(temp_filename)
+            raise
+        self._prune()
+
+    def _prune(self):
+        # Removes the least recently used files beyond max_disk_size
+        entries = []
+        for filename in os.listdir(self.cache_path):
+            if not filename.endswith('.html'):
+                continue
+            filename = os.path.join(self.cache_path, filename)
+            try:
+                entries.append((os.path.getmtime(filename), filename))
+            # Removed by another thread or process
+            except (OSError, EnvironmentError):
+                pass
+        if len(entries) <= self.max_disk_size:
+            return
+        entries.sort()
+        for _, filename in entries[:len(entries) - self.max_disk_size]:
+            try:
+                os.remove(filename)
+            except (OSError, EnvironmentError) as ex:
+                if ex.errno != errno.ENOENT:
+                    raise
+
+    def _remember(self, key, content):
+        with self._lock:
+            self._entries[key] = content
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def key(self, *parts):
+        """
+        Returns a cache key for the specified JSON-serializable parts.
+        """
+        data = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        Returns the cached content for the specified key, or None if
+        nothing was cached for it.
+        """
+        with self._lock:
+            content = self._entries.get(key)
+            if content is not None:
+                self._entries.move_to_end(key)
+                return content
+
+        if not self.cache_path:
+            return None
+
+        content = self._read(key)
+        if content is not None:
+            self._remember(key, content)
+        return content
+
+    def set(self, key, content):
+        """
+        Caches the specified content under the specified key.
+        """
+        self._remember(key, content)
+        if self.cache_path:
+            self._write(key, content)
+
+    def clear(self):
+        """
+        Clears the in-memory and on-disk render cache.
+        """
+        with self._lock:
+            self._entries.clear()
+        if self.cache_path and os.path.exists(self.cache_path):
+            shutil.rmtree(self.cache_path)
+
+
+class SingleFlight(object):
+    """
+    Coalesces concurrent calls for the same key into a single call.
+
+    The first caller for a key runs the function while every other caller
+    for that key waits on it and shares its result or exception.
+    """
+    def __init__(self):
+        super(SingleFlight, self).__init__()
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        Calls func with the specified arguments, or waits for the call
+        already in flight for key, and returns its result.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _FlightCall()
+                self._calls[key] = call
+
+        if not is_leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as ex:
+            call.error = ex
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class _FlightCall(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
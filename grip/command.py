@@ -29,6 +29,8 @@ Options:
                     serving, optionally using [<address>] as the out
                     file (- for stdout).
   --no-inline       Link to styles instead inlining when using --export.
+  --prune-styles    Drop the inlined styles and fonts that the exported
+                    page doesn't use when using --export.
   -b --browser      Open a tab in the browser after the server starts.
   --api-url=<url>   Specify a different base URL for the github API,
                     for example that of a Github Enterprise instance.
@@ -121,7 +123,8 @@ def main(argv=None, force_utf8=True, patch_svg=True):
             export(args['<path>'], args['--user-content'], args['--context'],
                    args['--user'], password, False, args['--wide'],
                    not args['--no-inline'], args['<address>'],
-                   args['--api-url'], args['--title'], args['--quiet'], theme)
+                   args['--api-url'], args['--title'], args['--quiet'], theme,
+                   prune_styles=args['--prune-styles'])
             return 0
         except ReadmeNotFoundError as ex:
             print('Error:', ex)
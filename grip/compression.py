@@ -0,0 +1,121 @@
+from __future__ import print_function, unicode_literals
+
+import mimetypes
+import zlib
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+COMPRESSIBLE_MIMETYPES = [
+    'application/javascript', 'application/json', 'application/xml',
+    'image/svg+xml']
+ENCODING_EXTENSIONS = {'br': '.br', 'gzip': '.gz'}
+
+
+def supported_encodings():
+    """
+    Returns the content encodings that can be produced, best first.
+
+    Brotli is only supported when the brotli package is installed.
+    """
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def is_compressible(mimetype):
+    """
+    Returns whether content of the specified mimetype is worth compressing.
+    """
+    if not mimetype:
+        return False
+    return (mimetype.startswith('text/') or
+            mimetype in COMPRESSIBLE_MIMETYPES)
+
+
+def choose_encoding(accept_encodings, encodings=None):
+    """
+    Returns the best of the specified content encodings the client
+    accepts, according to its Accept-Encoding header, or None.
+    """
+    if encodings is None:
+        encodings = supported_encodings()
+    for encoding in encodings:
+        if accept_encodings[encoding] > 0:
+            return encoding
+    return None
+
+
+def _compressobj(encoding, level):
+    if encoding == 'br':
+        if level is None:
+            level = 5
+        return brotli.Compressor(quality=level)
+    if encoding == 'gzip':
+        if level is None:
+            level = 6
+        # Use a gzip header and trailer around the deflate stream
+        return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    raise ValueError('Unsupported content encoding: {0!r}'.format(encoding))
+
+
+def compress(data, encoding, level=None):
+    """
+    Returns the specified bytes compressed with the specified content
+    encoding.
+    """
+    if encoding == 'br':
+        return brotli.compress(data, quality=5 if level is None else level)
+    compressor = _compressobj(encoding, level)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_stream(chunks, encoding, level=None):
+    """
+    Yields the specified chunks of bytes compressed with the specified
+    content encoding.
+
+    Each chunk is flushed as soon as it's compressed, so clients can
+    decompress it without waiting for the next one, like the messages of
+    an event stream, while the compression window is still shared by all
+    chunks.
+    """
+    compressor = _compressobj(encoding, level)
+    for chunk in chunks:
+        if encoding == 'br':
+            data = compressor.process(chunk) + compressor.flush()
+        else:
+            data = (compressor.compress(chunk) +
+                    compressor.flush(zlib.Z_SYNC_FLUSH))
+        if data:
+            yield data
+    if encoding == 'br':
+        yield compressor.finish()
+    else:
+        yield compressor.flush()
+
+
+def precompressed_filename(filename, encoding):
+    """
+    Returns the filename of the specified file's precompressed variant.
+    """
+    return filename + ENCODING_EXTENSIONS[encoding]
+
+
+def precompress(filename, data, encodings=None):
+    """
+    Returns the specified contents of the specified file compressed with
+    each of the specified content encodings, keyed by encoding, or an
+    empty dict if the file's type isn't compressible.
+
+    The variants are meant to be stored next to the file, under their
+    precompressed_filename.
+    """
+    if encodings is None:
+        encodings = supported_encodings()
+    if not is_compressible(mimetypes.guess_type(filename)[0]):
+        return {}
+    # Spend more time on files that are compressed only once
+    return dict(
+        (encoding, compress(data, encoding, 11 if encoding == 'br' else 9))
+        for encoding in encodings)
@@ -33,6 +33,13 @@ STYLE_URLS_RES = [
 ]
 STYLE_ASSET_URLS_RE = (
     r'''url\(['"]?(/static/fonts/octicons/[^'" \)]+)['"]?\)''')
-STYLE_ASSET_URLS_SUB_FORMAT = r'url("{0}\1")'
+STYLE_ASSET_URLS_SUB_FORMAT = r'url("{0}\1?v={1}")'
 STYLE_ASSET_URLS_INLINE_FORMAT = (
     r'''url\(['"]?((?:/static|{0})/[^'" \)]+)['"]?\)''')
+
+
+# The file listing the cached styles and assets, written once all are cached
+ASSET_MANIFEST_FILENAME = 'manifest.json'
+ASSET_MANIFEST_VERSION = 1
+# The number of hex digits of a cached file's hash to version its URL with
+ASSET_URL_DIGEST_LENGTH = 16
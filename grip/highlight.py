@@ -0,0 +1,154 @@
+from __future__ import print_function, unicode_literals
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import markdown
+from markdown.extensions.fenced_code import FencedBlockPreprocessor
+from markdown.preprocessors import Preprocessor
+from pygments import highlight
+from pygments.formatters import HtmlFormatter
+from pygments.lexers import TextLexer, get_lexer_by_name
+from pygments.util import ClassNotFound
+
+
+class HighlightCache(object):
+    """
+    Caches syntax highlighted code by its language, a hash of the code,
+    and the formatter options, keeping up to max_size entries.
+
+    Lexers and formatters are resolved once and reused, so code that was
+    already highlighted doesn't go through Pygments again.
+    """
+    def __init__(self, max_size=None):
+        if max_size is None:
+            max_size = 512
+        super(HighlightCache, self).__init__()
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lexers = {}
+        self._formatters = {}
+        self._lock = threading.Lock()
+
+    def _lexer(self, lang):
+        # Returns the lexer for the language, or None if it's unknown
+        with self._lock:
+            if lang in self._lexers:
+                return self._lexers[lang]
+        try:
+            lexer = get_lexer_by_name(lang) if lang else None
+        except ClassNotFound:
+            lexer = None
+        with self._lock:
+            self._lexers[lang] = lexer
+        return lexer
+
+    def has_lexer(self, lang):
+        """
+        Returns whether Pygments has a lexer for the specified language.
+        """
+        return self._lexer(lang) is not None
+
+    def lexer_for(self, lang):
+        """
+        Returns the Pygments lexer for the specified language, or a plain
+        text lexer if the language is unknown.
+        """
+        lexer = self._lexer(lang)
+        return lexer if lexer is not None else TextLexer()
+
+    def formatter_for(self, css_class):
+        """
+        Returns the HTML formatter for the specified CSS class.
+        """
+        with self._lock:
+            formatter = self._formatters.get(css_class)
+        if formatter is None:
+            formatter = HtmlFormatter(cssclass=css_class, wrapcode=True)
+            with self._lock:
+                self._formatters[css_class] = formatter
+        return formatter
+
+    def highlight(self, code, lang=None, css_class=None):
+        """
+        Returns the specified code highlighted as HTML.
+        """
+        if css_class is None:
+            css_class = 'highlight'
+        digest = hashlib.sha256(code.encode('utf-8')).hexdigest()
+        key = (lang, digest, css_class)
+        with self._lock:
+            html = self._entries.get(key)
+            if html is not None:
+                self._entries.move_to_end(key)
+                return html
+
+        html = highlight(
+            code, self.lexer_for(lang), self.formatter_for(css_class))
+        with self._lock:
+            self._entries[key] = html
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return html
+
+    def clear(self):
+        """
+        Clears the cached highlighted code.
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+class CachedFencedBlockPreprocessor(Preprocessor):
+    """
+    Highlights fenced code blocks through a HighlightCache and stores the
+    result in the HTML stash.
+
+    Blocks without a known language, or with attribute lists or
+    highlighted lines, are left for the fenced_code extension to handle,
+    so codehilite can still guess their language, like from a shebang.
+    """
+    def __init__(self, md, cache, css_class):
+        super(CachedFencedBlockPreprocessor, self).__init__(md)
+        self.cache = cache
+        self.css_class = css_class
+
+    def _replace(self, match):
+        groups = match.groupdict()
+        lang = groups.get('lang')
+        if (not lang or groups.get('attrs') or groups.get('hl_lines') or
+                not self.cache.has_lexer(lang)):
+            return match.group(0)
+        html = self.cache.highlight(groups['code'], lang, self.css_class)
+        return '\n{0}\n'.format(self.md.htmlStash.store(html))
+
+    def run(self, lines):
+        text = '\n'.join(lines)
+        text = FencedBlockPreprocessor.FENCED_BLOCK_RE.sub(self._replace, text)
+        return text.split('\n')
+
+
+class HighlightExtension(markdown.Extension):
+    """
+    Highlights fenced code blocks with the specified HighlightCache, before
+    the fenced_code extension would.
+    """
+    def __init__(self, cache=None, css_class=None, **kwargs):
+        if cache is None:
+            cache = HighlightCache()
+        if css_class is None:
+            css_class = 'highlight'
+        super(HighlightExtension, self).__init__(**kwargs)
+        self.cache = cache
+        self.css_class = css_class
+
+    def extendMarkdown(self, md, md_globals=None):
+        preprocessor = CachedFencedBlockPreprocessor(
+            md, self.cache, self.css_class)
+        if hasattr(md.preprocessors, 'register'):
+            # Python-Markdown 3.0+
+            md.preprocessors.register(preprocessor, 'grip_highlight', 26)
+        else:
+            md.preprocessors.add(
+                'grip_highlight', preprocessor, '<fenced_code_block')
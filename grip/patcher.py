@@ -1,34 +1,208 @@
+from __future__ import print_function, unicode_literals
+
 import re
+import threading
 
 
-INCOMPLETE_TASK_RE = re.compile(r'<li>\[ \] (.*?)(<ul.*?>|</li>)', re.DOTALL)
-INCOMPLETE_TASK_SUB = (r'<li class="task-list-item">'
-                       r'<input type="checkbox" '
-                       r'class="task-list-item-checkbox" disabled=""> \1\2')
-COMPLETE_TASK_RE = re.compile(r'<li>\[x\] (.*?)(<ul.*?>|</li>)', re.DOTALL)
-COMPLETE_TASK_SUB = (r'<li class="task-list-item">'
-                     r'<input type="checkbox" class="task-list-item-checkbox" '
-                     r'checked="" disabled=""> \1\2')
+INCOMPLETE_TASK_RE = r'<li>\[ \] '
+INCOMPLETE_TASK_SUB = ('<li class="task-list-item">'
+                       '<input type="checkbox" '
+                       'class="task-list-item-checkbox" disabled=""> ')
+COMPLETE_TASK_RE = r'<li>\[x\] '
+COMPLETE_TASK_SUB = ('<li class="task-list-item">'
+                     '<input type="checkbox" class="task-list-item-checkbox" '
+                     'checked="" disabled=""> ')
 
 
-HEADER_PATCH_RE = re.compile(r'<span>{:"aria-hidden"=&gt;"true", :class=&gt;'
-                             r'"octicon octicon-link"}</span>', re.DOTALL)
-HEADER_PATCH_SUB = r'<span class="octicon octicon-link"></span>'
+HEADER_PATCH_RE = (r'<span>{:"aria-hidden"=&gt;"true", :class=&gt;'
+                   r'"octicon octicon-link"}</span>')
+HEADER_PATCH_SUB = '<span class="octicon octicon-link"></span>'
 
 
-def patch(html, user_content=False):
+def _has_alternation(pattern):
+    # Returns whether the pattern has a '|' outside of groups and sets
+    depth = 0
+    in_set = False
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        if char == '\\':
+            index += 1
+        elif in_set:
+            in_set = char != ']'
+        elif char == '[':
+            in_set = True
+            # A ']' right after '[' or '[^' is a literal
+            if pattern[index + 1:index + 2] == '^':
+                index += 1
+            if pattern[index + 1:index + 2] == ']':
+                index += 1
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '|' and depth == 0:
+            return True
+        index += 1
+    return False
+
+
+def _combine(fixups):
     """
-    Processes the HTML rendered by the GitHub API, patching
-    any inconsistencies from the main site.
+    Combines the patterns of the specified fix-ups into one expression,
+    naming the group of each fix-up by its index.
+    """
+    patterns = [fixup.pattern.pattern for fixup in fixups]
+    # Factor out a shared first character, like the '<' of a tag, so the
+    # regex engine can skip to it instead of trying every fix-up at every
+    # position of the HTML. A top-level '|' would leave the character
+    # applying to its first branch only, so those patterns aren't factored.
+    first = patterns[0][:1]
+    prefix = ''
+    if first and first not in '\\.^$*+?{}[]|()' and all(
+            pattern[:1] == first and pattern[1:2] not in ('*', '+', '?', '{')
+            and not _has_alternation(pattern)
+            for pattern in patterns):
+        prefix = first
+        patterns = [pattern[1:] for pattern in patterns]
+    return re.compile('{0}(?:{1})'.format(prefix, '|'.join(
+        '(?P<f{0}>{1})'.format(index, pattern)
+        for index, pattern in enumerate(patterns))))
+
+
+def _build_scanners(fixups):
+    """
+    Returns the combined expression and the fix-ups to apply, with and
+    without user-content, or raises ValueError if they can't be combined.
     """
+    flags = re.compile('').flags
+    for fixup in fixups:
+        if fixup.pattern.flags != flags:
+            raise ValueError(
+                'Fix-up {0!r} uses inline global flags, which would apply '
+                'to every fix-up'.format(fixup.name))
+    scanners = {}
+    for user_content in [False, True]:
+        included = [f for f in fixups if f.user_content or not user_content]
+        try:
+            regex = _combine(included) if included else None
+        except re.error as ex:
+            raise ValueError(
+                'Could not combine the fix-up patterns: {0}'.format(ex))
+        scanners[user_content] = (regex, included)
+    return scanners
+
+
+class Fixup(object):
+    """
+    A fix-up that replaces each match of the specified regular expression
+    in the rendered HTML with replacement, either a string or a function
+    that's called with the match object and returns a string.
+
+    Set user_content to False to skip the fix-up when patching
+    user-content.
+    """
+    def __init__(self, name, pattern, replacement, user_content=None):
+        if user_content is None:
+            user_content = True
+        super(Fixup, self).__init__()
+        self.name = name
+        self.pattern = re.compile(pattern)
+        self.replacement = replacement
+        self.user_content = user_content
+
+    def replace(self, text):
+        """
+        Returns the replacement for the specified matched text.
+        """
+        # Plain strings don't need the match
+        if not callable(self.replacement) and '\\' not in self.replacement:
+            return self.replacement
+        match = self.pattern.match(text)
+        if callable(self.replacement):
+            return self.replacement(match)
+        return match.expand(self.replacement)
+
+
+class Patcher(object):
+    """
+    Patches the HTML rendered by the GitHub API with a list of fix-ups.
+
+    The fix-ups are combined into a single regular expression, so the
+    HTML is scanned once no matter how many fix-ups are registered, and
+    the cost is linear in the size of the HTML. Fix-up patterns must not
+    use backreferences or inline global flags, like (?i), since those
+    would apply to every fix-up. Use scoped flags, like (?i:...), instead.
+    """
+    def __init__(self, fixups=None):
+        super(Patcher, self).__init__()
+        self.fixups = list(fixups or [])
+        self._scanners = _build_scanners(self.fixups)
+        self._lock = threading.Lock()
+
+    def register(self, name, pattern, replacement, user_content=None):
+        """
+        Adds a fix-up, replacing any fix-up with the same name.
+
+        Raises ValueError if the pattern can't be combined with the
+        other fix-ups, leaving them unchanged.
+        """
+        fixup = Fixup(name, pattern, replacement, user_content)
+        with self._lock:
+            fixups = [f for f in self.fixups if f.name != name] + [fixup]
+            self._scanners = _build_scanners(fixups)
+            self.fixups = fixups
+        return fixup
+
+    def unregister(self, name):
+        """
+        Removes the fix-up with the specified name.
+        """
+        with self._lock:
+            fixups = [f for f in self.fixups if f.name != name]
+            self._scanners = _build_scanners(fixups)
+            self.fixups = fixups
+
+    def _scanner(self, user_content):
+        # Returns the combined expression and its fix-ups
+        with self._lock:
+            return self._scanners[bool(user_content)]
+
+    def patch(self, html, user_content=False):
+        """
+        Returns the specified HTML with every fix-up applied.
+        """
+        regex, fixups = self._scanner(user_content)
+        if regex is None:
+            return html
+        return regex.sub(
+            lambda match: fixups[int(match.lastgroup[1:])].replace(
+                match.group()), html)
+
+
+default_patcher = Patcher([
     # FUTURE: Remove this once GitHub API renders task lists
     # https://github.com/isaacs/github/issues/309
-    if not user_content:
-        html = INCOMPLETE_TASK_RE.sub(INCOMPLETE_TASK_SUB, html)
-        html = COMPLETE_TASK_RE.sub(COMPLETE_TASK_SUB, html)
-
+    Fixup('incomplete-task', INCOMPLETE_TASK_RE, INCOMPLETE_TASK_SUB,
+          user_content=False),
+    Fixup('complete-task', COMPLETE_TASK_RE, COMPLETE_TASK_SUB,
+          user_content=False),
     # FUTURE: Remove this once GitHub API fixes the header bug
     # https://github.com/joeyespo/grip/issues/244
-    html = HEADER_PATCH_RE.sub(HEADER_PATCH_SUB, html)
+    Fixup('header-octicon', HEADER_PATCH_RE, HEADER_PATCH_SUB),
+])
+
 
-    return html
+def patch(html, user_content=False):
+    """
+    Processes the HTML rendered by the GitHub API, patching
+    any inconsistencies from the main site.
+    """
+    return default_patcher.patch(html, user_content)
+
+
+def register_fixup(name, pattern, replacement, user_content=None):
+    """
+    Adds a fix-up to the default patcher used on GitHub API renders.
+    """
+    return default_patcher.register(name, pattern, replacement, user_content)
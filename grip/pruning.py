@@ -0,0 +1,224 @@
+from __future__ import print_function, unicode_literals
+
+import re
+try:
+    from html.parser import HTMLParser
+except ImportError:
+    from HTMLParser import HTMLParser
+
+
+STYLE_BLOCK_RE = re.compile(
+    r'(<style\b[^>]*>)(.*?)(</style>)', re.DOTALL | re.IGNORECASE)
+COMMENT_RE = re.compile(r'/\*.*?\*/', re.DOTALL)
+SPECIAL_RE = re.compile(r'[{};"\'\\]')
+PARENS_RE = re.compile(r'\([^()]*\)')
+ATTRIBUTE_RE = re.compile(r'\[[^\]]*\]')
+PSEUDO_RE = re.compile(r'(?<!\\)::?[\w-]+')
+COMBINATOR_RE = re.compile(r'\s*[\s>+~]\s*')
+TAG_RE = re.compile(r'^[a-zA-Z][\w-]*')
+NAME_RE = re.compile(r'([.#])((?:[\w-]|\\.)+)')
+HEX_ESCAPE_RE = re.compile(r'\\[0-9a-fA-F]')
+FONT_FAMILY_RE = re.compile(r'font-family\s*:\s*([^;}]+)', re.IGNORECASE)
+KEYFRAMES_NAME_RE = re.compile(r'^@[\w-]*keyframes\s+(\S+)', re.IGNORECASE)
+GROUPING_AT_RULES = [
+    'container', 'document', '-moz-document', 'layer', 'media', 'supports']
+
+
+class UsedSelectors(HTMLParser):
+    """
+    Collects the tags, classes, and ids used by the HTML fed to it.
+    """
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.tags = set()
+        self.classes = set()
+        self.ids = set()
+
+    def handle_starttag(self, tag, attrs):
+        self.tags.add(tag.lower())
+        for name, value in attrs:
+            if name == 'class' and value:
+                self.classes.update(value.split())
+            elif name == 'id' and value:
+                self.ids.add(value)
+
+    def can_match(self, selector):
+        """
+        Returns whether the specified complex selector could match the
+        collected HTML.
+
+        Only tags, classes, and ids are checked. Anything else, like
+        attributes and pseudo-classes, is assumed to match.
+        """
+        selector = selector.strip()
+        if HEX_ESCAPE_RE.search(selector):
+            return True
+        # Remove arguments from the innermost out, as in :not(:is(...))
+        while True:
+            stripped = PARENS_RE.sub('', selector)
+            if stripped == selector:
+                break
+            selector = stripped
+        selector = PSEUDO_RE.sub('', ATTRIBUTE_RE.sub('', selector))
+        for compound in COMBINATOR_RE.split(selector):
+            match = TAG_RE.match(compound)
+            if match and match.group().lower() not in self.tags:
+                return False
+            for kind, name in NAME_RE.findall(compound):
+                name = name.replace('\\', '')
+                names = self.classes if kind == '.' else self.ids
+                if name not in names:
+                    return False
+        return True
+
+
+def _split(text, separator):
+    # Splits text on the separator outside of strings and parentheses
+    parts = []
+    depth = 0
+    quote = None
+    start = 0
+    index = 0
+    while index < len(text):
+        char = text[index]
+        if char == '\\':
+            index += 2
+            continue
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in '\'"':
+            quote = char
+        elif char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        elif char == separator and depth == 0:
+            parts.append(text[start:index])
+            start = index + 1
+        index += 1
+    parts.append(text[start:])
+    return parts
+
+
+def iter_rules(css):
+    """
+    Yields the prelude and the block of each top-level rule of the
+    specified CSS, with a block of None for statements like @import.
+    """
+    css = COMMENT_RE.sub('', css)
+    depth = 0
+    start = 0
+    block_start = None
+    index = 0
+    while True:
+        # Jump between the characters that matter instead of every one
+        match = SPECIAL_RE.search(css, index)
+        if match is None:
+            break
+        char = match.group()
+        index = match.end()
+        if char == '\\':
+            index += 1
+        elif char in '\'"':
+            end = css.find(char, index)
+            while end != -1 and css[end - 1] == '\\':
+                end = css.find(char, end + 1)
+            index = len(css) if end == -1 else end + 1
+        elif char == '{':
+            if depth == 0:
+                block_start = index - 1
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                yield css[start:block_start], css[block_start + 1:index - 1]
+                start = index
+            elif depth < 0:
+                # Skip a stray closing brace
+                depth = 0
+                start = index
+        elif depth == 0:
+            yield css[start:index - 1], None
+            start = index
+    if css[start:].strip() and depth == 0:
+        yield css[start:], None
+
+
+def _prune(css, used, deferred):
+    parts = []
+    for prelude, block in iter_rules(css):
+        prelude = prelude.strip()
+        if block is None:
+            if prelude:
+                parts.append(prelude + ';')
+            continue
+        if not prelude.startswith('@'):
+            selectors = [selector.strip()
+                         for selector in _split(prelude, ',')
+                         if used.can_match(selector)]
+            if selectors:
+                parts.append('{0}{{{1}}}'.format(','.join(selectors), block))
+            continue
+
+        name = prelude[1:].split(None, 1)[0].split('(', 1)[0].lower()
+        if name in GROUPING_AT_RULES:
+            block = _prune(block, used, deferred)
+            if block.strip():
+                parts.append('{0}{{{1}}}'.format(prelude, block))
+        elif name == 'font-face' or name.endswith('keyframes'):
+            # Decide once it's known which fonts and animations are used
+            parts.append('\0{0}\0'.format(len(deferred)))
+            deferred.append((prelude, block))
+        else:
+            parts.append('{0}{{{1}}}'.format(prelude, block))
+    return ''.join(parts)
+
+
+def _is_used(prelude, block, text):
+    if prelude.lower().startswith('@font-face'):
+        match = FONT_FAMILY_RE.search(block)
+        if match is None:
+            return True
+        family = match.group(1).strip().strip('\'"')
+        return family in text
+    match = KEYFRAMES_NAME_RE.match(prelude)
+    if match is None:
+        return True
+    return re.search(
+        r'(?<![\w-]){0}(?![\w-])'.format(re.escape(match.group(1))),
+        text) is not None
+
+
+def prune_css(css, used):
+    """
+    Returns the specified CSS without the rules whose selectors can't
+    match any element collected by used, a UsedSelectors instance.
+
+    Fonts and animations are dropped when no remaining rule refers to
+    them, so unused fonts aren't embedded.
+    """
+    deferred = []
+    pruned = _prune(css, used, deferred)
+    text = re.sub(r'\0\d+\0', '', pruned)
+
+    def resolve(match):
+        prelude, block = deferred[int(match.group(1))]
+        if not _is_used(prelude, block, text):
+            return ''
+        return '{0}{{{1}}}'.format(prelude, block)
+
+    return re.sub(r'\0(\d+)\0', resolve, pruned)
+
+
+def prune_unused_styles(html):
+    """
+    Returns the specified HTML page with the CSS rules of its inline
+    <style> elements that can't match any of its elements removed.
+    """
+    used = UsedSelectors()
+    used.feed(STYLE_BLOCK_RE.sub('', html))
+    used.close()
+    return STYLE_BLOCK_RE.sub(
+        lambda match: match.group(1) + prune_css(match.group(2), used) +
+        match.group(3), html)
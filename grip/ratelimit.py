@@ -0,0 +1,326 @@
+from __future__ import print_function, unicode_literals
+
+import hashlib
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from requests.auth import AuthBase, HTTPBasicAuth
+
+
+def _parse_rate_limit(response):
+    """
+    Returns the (limit, remaining, reset) values from the rate limit
+    headers of the specified response, or None if they're missing.
+    """
+    headers = response.headers
+    try:
+        return (int(headers['X-RateLimit-Limit']),
+                int(headers['X-RateLimit-Remaining']),
+                float(headers['X-RateLimit-Reset']))
+    except (KeyError, ValueError):
+        return None
+
+
+def _is_rate_limited(response, remaining=None):
+    """
+    Returns whether the specified response was rejected by the rate limit.
+    """
+    return response.status_code == 429 or (
+        response.status_code == 403 and
+        ('Retry-After' in response.headers or remaining == 0))
+
+
+def _credential_key(response):
+    # Tracks each credential's budget without keeping the credential itself
+    request = getattr(response, 'request', None)
+    authorization = request.headers.get('Authorization') if request else None
+    if authorization is None:
+        return None
+    return hashlib.sha256(authorization.encode('utf-8')).hexdigest()
+
+
+class RateLimiter(object):
+    """
+    Schedules GitHub API requests within the rate limit that GitHub
+    reports in the X-RateLimit-* response headers.
+
+    Requests made in a background() block, like autorefresh renders,
+    are spread evenly over the time left until the limit resets with a
+    token bucket of burst tokens, and leave reserve requests for page
+    loads, which are never delayed. Background requests that are
+    rejected with 403 or 429 are retried up to max_retries times after
+    an exponential backoff with jitter, starting at backoff seconds.
+
+    When requests are sent with several credentials, like with a
+    TokenPool, the budget is the total of every credential's budget.
+    """
+    def __init__(self, reserve=None, burst=None, backoff=None,
+                 max_backoff=None, max_retries=None):
+        if reserve is None:
+            reserve = 10
+        if burst is None:
+            burst = 5
+        if backoff is None:
+            backoff = 1.0
+        if max_backoff is None:
+            max_backoff = 60.0
+        if max_retries is None:
+            max_retries = 3
+        super(RateLimiter, self).__init__()
+        self.reserve = reserve
+        self.burst = burst
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_retries = max_retries
+        self.limit = None
+        self.remaining = None
+        self.reset = None
+        self.tokens = float(burst)
+        self.backoff_until = 0
+        self.failures = 0
+        self._budgets = {}
+        self._refilled_at = time.time()
+        self._local = threading.local()
+        self._condition = threading.Condition()
+
+    def _total(self, now):
+        # Combine the budgets of the credentials that haven't reset yet
+        for key, (_, _, reset) in list(self._budgets.items()):
+            if now >= reset:
+                del self._budgets[key]
+        if not self._budgets:
+            self.limit = self.remaining = self.reset = None
+            return
+        budgets = self._budgets.values()
+        self.limit = sum(limit for limit, _, _ in budgets)
+        self.remaining = sum(remaining for _, remaining, _ in budgets)
+        self.reset = max(reset for _, _, reset in budgets)
+
+    def _refill(self, now):
+        # Spread the remaining budget evenly until the limit resets
+        if self.remaining is not None and self.reset is not None:
+            if now >= self.reset:
+                self._total(now)
+                self.tokens = float(self.burst)
+            else:
+                budget = max(self.remaining - self.reserve, 0)
+                rate = budget / (self.reset - now)
+                self.tokens = min(
+                    self.tokens + rate * (now - self._refilled_at),
+                    float(self.burst))
+        self._refilled_at = now
+
+    def _delay(self, now):
+        # Returns how long a background request must wait, or 0 to send it
+        if now < self.backoff_until:
+            return self.backoff_until - now
+        if self.remaining is None:
+            return 0
+        if self.remaining <= self.reserve:
+            return self.reset - now
+        if self.tokens >= 1:
+            return 0
+        budget = max(self.remaining - self.reserve, 0)
+        return (1 - self.tokens) * (self.reset - now) / budget
+
+    @property
+    def is_background(self):
+        """
+        Whether requests on the current thread are background requests.
+        """
+        return getattr(self._local, 'background', False)
+
+    @contextmanager
+    def background(self):
+        """
+        Marks the requests made on the current thread within the block
+        as background requests.
+        """
+        previous = self.is_background
+        self._local.background = True
+        try:
+            yield
+        finally:
+            self._local.background = previous
+
+    def acquire(self):
+        """
+        Blocks until a request can be sent without exceeding the rate
+        limit. This returns immediately outside of a background() block.
+        """
+        with self._condition:
+            while True:
+                now = time.time()
+                self._refill(now)
+                delay = 0 if not self.is_background else self._delay(now)
+                if delay <= 0:
+                    break
+                self._condition.wait(delay)
+            self.tokens = max(self.tokens - 1, 0)
+            if self.remaining is not None:
+                self.remaining = max(self.remaining - 1, 0)
+
+    def update(self, response):
+        """
+        Updates the budget from the headers of the specified response.
+        Returns whether the request was rate limited and should be sent
+        again after backing off.
+        """
+        headers = response.headers
+        rate_limit = _parse_rate_limit(response)
+        with self._condition:
+            now = time.time()
+            self._refill(now)
+            # Include responses from credentials that a TokenPool failed over
+            for r in list(getattr(response, 'history', [])) + [response]:
+                budget = _parse_rate_limit(r)
+                if budget is not None:
+                    self._budgets[_credential_key(r)] = budget
+            self._total(now)
+
+            remaining = rate_limit[1] if rate_limit is not None else None
+            if not _is_rate_limited(response, remaining):
+                self.failures = 0
+                self._condition.notify_all()
+                return False
+
+            # Back off exponentially with jitter, or as long as requested
+            self.failures += 1
+            delay = min(self.backoff * 2 ** (self.failures - 1),
+                        self.max_backoff)
+            delay *= random.uniform(0.5, 1.5)
+            try:
+                delay = max(delay, float(headers['Retry-After']))
+            except (KeyError, ValueError):
+                pass
+            self.backoff_until = max(self.backoff_until, now + delay)
+            return self.is_background and self.failures <= self.max_retries
+
+    def status(self):
+        """
+        Returns a dict describing the current rate limit budget.
+        """
+        with self._condition:
+            now = time.time()
+            self._refill(now)
+            return {
+                'limit': self.limit,
+                'remaining': self.remaining,
+                'reset': self.reset,
+                'reserve': self.reserve,
+                'tokens': self.tokens,
+                'backoff': max(self.backoff_until - now, 0),
+            }
+
+
+class TokenPool(AuthBase):
+    """
+    Authenticates each request with one of several GitHub credentials,
+    choosing the one with the most remaining quota according to the
+    rate limit headers of its previous responses.
+
+    Credentials are personal access tokens or (username, password)
+    tuples. When a request is rejected by the rate limit, it is sent
+    again with the next credential that still has quota left.
+    """
+    def __init__(self, credentials):
+        super(TokenPool, self).__init__()
+        self.credentials = [
+            tuple(credential) if isinstance(credential, (list, tuple))
+            else ('', credential)
+            for credential in credentials]
+        self._quotas = [None] * len(self.credentials)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.credentials)
+
+    def __call__(self, r):
+        index = self.select()
+        if index is None:
+            return r
+        HTTPBasicAuth(*self.credentials[index])(r)
+        r.register_hook('response', self._failover_hook([index]))
+        return r
+
+    def _failover_hook(self, tried):
+        def handle_response(r, **kwargs):
+            return self._handle_response(r, tried, **kwargs)
+        return handle_response
+
+    def _handle_response(self, r, tried, **kwargs):
+        while True:
+            self.update(tried[-1], r)
+            if not _is_rate_limited(r, self._remaining(tried[-1])):
+                return r
+            index = self.select(exclude=tried)
+            if index is None:
+                return r
+            tried.append(index)
+
+            # Release the connection and resend with the next credential
+            r.content
+            r.close()
+            prep = r.request.copy()
+            HTTPBasicAuth(*self.credentials[index])(prep)
+            _r = r.connection.send(prep, **kwargs)
+            _r.history.append(r)
+            _r.request = prep
+            r = _r
+
+    def _remaining(self, index):
+        with self._lock:
+            quota = self._quotas[index]
+        return quota[1] if quota is not None else None
+
+    def select(self, exclude=None):
+        """
+        Returns the index of the credential to use next, or None if every
+        credential not in exclude is known to have no quota left.
+        """
+        now = time.time()
+        best, best_remaining = None, None
+        with self._lock:
+            for index, quota in enumerate(self._quotas):
+                if exclude and index in exclude:
+                    continue
+                # Treat credentials that were never used or have since
+                # reset as having their full quota
+                if quota is None or now >= quota[2]:
+                    remaining = float('inf')
+                else:
+                    remaining = quota[1]
+                if remaining > 0 and (best is None or
+                                      remaining > best_remaining):
+                    best, best_remaining = index, remaining
+        if best is None and not exclude and self.credentials:
+            # Every credential is exhausted, so use the one resetting first
+            with self._lock:
+                best = min(range(len(self._quotas)),
+                           key=lambda index: self._quotas[index][2])
+        return best
+
+    def update(self, index, response):
+        """
+        Updates the quota of the specified credential from the rate limit
+        headers of the specified response.
+        """
+        rate_limit = _parse_rate_limit(response)
+        with self._lock:
+            if rate_limit is not None:
+                self._quotas[index] = rate_limit
+            elif _is_rate_limited(response) and self._quotas[index]:
+                limit, _, reset = self._quotas[index]
+                self._quotas[index] = (limit, 0, reset)
+
+    def status(self):
+        """
+        Returns a list describing the quota of each credential.
+        """
+        with self._lock:
+            return [{'limit': quota[0], 'remaining': quota[1],
+                     'reset': quota[2]} if quota else
+                    {'limit': None, 'remaining': None, 'reset': None}
+                    for quota in self._quotas]
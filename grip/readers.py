@@ -1,11 +1,15 @@
 from __future__ import print_function, unicode_literals
 
+import ctypes
+import ctypes.util
 import errno
 import io
 import mimetypes
 import os
 import posixpath
+import select
 import sys
+import time
 from abc import ABCMeta, abstractmethod
 
 from ._compat import safe_join
@@ -15,6 +19,160 @@ from .exceptions import ReadmeNotFoundError
 from .vendor.six import add_metaclass
 
 
+# Flags and events from <sys/inotify.h>
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+IN_WATCH_MASK = (
+    0x00000002 |  # IN_MODIFY
+    0x00000004 |  # IN_ATTRIB
+    0x00000008 |  # IN_CLOSE_WRITE
+    0x00000040 |  # IN_MOVED_FROM
+    0x00000080 |  # IN_MOVED_TO
+    0x00000100 |  # IN_CREATE
+    0x00000200 |  # IN_DELETE
+    0x00000400 |  # IN_DELETE_SELF
+    0x00000800)   # IN_MOVE_SELF
+
+
+def _encode_path(path):
+    # Encodes the path for the OS like os.fsencode, which is Python 3 only
+    if isinstance(path, bytes):
+        return path
+    return path.encode(sys.getfilesystemencoding() or 'utf-8')
+
+
+class PollingWatch(object):
+    """
+    A watch that can't detect changes itself, so it waits for the
+    polling interval before letting the caller check for changes.
+    """
+    def __init__(self, interval):
+        super(PollingWatch, self).__init__()
+        self.interval = interval
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def wait(self, timeout=None):
+        """
+        Blocks until the watched path may have changed or until timeout
+        seconds have passed. Returns whether a change was detected.
+        """
+        time.sleep(self.interval if timeout is None
+                   else max(min(self.interval, timeout), 0))
+        return False
+
+    def close(self):
+        pass
+
+
+class PollingWatcher(object):
+    """
+    Watches files by checking them every interval seconds. This works on
+    every platform and is used when native file events are unavailable.
+    """
+    def __init__(self, interval=None):
+        if interval is None:
+            interval = 0.3
+        super(PollingWatcher, self).__init__()
+        self.interval = interval
+
+    def watch(self, path):
+        """
+        Returns a watch for the specified file to use as a context manager.
+        """
+        return PollingWatch(self.interval)
+
+
+class InotifyWatch(PollingWatch):
+    """
+    A watch on the directory of a file using a dedicated inotify instance.
+
+    The directory is watched, rather than the file, so that editors that
+    save by writing a temporary file and renaming it are still detected.
+    """
+    def __init__(self, libc, path, interval):
+        super(InotifyWatch, self).__init__(interval)
+        self.fd = None
+        try:
+            directory = _encode_path(os.path.dirname(os.path.abspath(path)))
+        except UnicodeError:
+            return
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return
+        if libc.inotify_add_watch(fd, directory, IN_WATCH_MASK) < 0:
+            os.close(fd)
+            return
+        self.fd = fd
+
+    def wait(self, timeout=None):
+        """
+        Blocks until a file event occurs in the watched directory or
+        until timeout seconds have passed. Returns whether an event
+        occurred. This falls back to polling if the watch could not be
+        created, e.g. when the directory does not exist.
+        """
+        if self.fd is None:
+            return super(InotifyWatch, self).wait(timeout)
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        # Drain the pending events since only their occurrence matters
+        try:
+            while os.read(self.fd, 4096):
+                pass
+        except (OSError, EnvironmentError) as ex:
+            if ex.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+        return True
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class InotifyWatcher(PollingWatcher):
+    """
+    Watches files using Linux inotify through ctypes, which reports
+    changes immediately without periodically checking each file.
+
+    Raises OSError if inotify is not available on this platform.
+    """
+    def __init__(self, interval=None):
+        super(InotifyWatcher, self).__init__(interval)
+        if not sys.platform.startswith('linux'):
+            raise OSError(errno.ENOSYS, 'inotify is only available on Linux')
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                           use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, 'inotify is not supported by libc')
+        libc.inotify_add_watch.argtypes = [
+            ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.libc = libc
+
+    def watch(self, path):
+        """
+        Returns a watch for the specified file to use as a context manager.
+        """
+        return InotifyWatch(self.libc, path, self.interval)
+
+
+def default_watcher():
+    """
+    Returns a native file watcher when one is available for the current
+    platform, or a polling watcher otherwise.
+    """
+    try:
+        return InotifyWatcher()
+    except (OSError, EnvironmentError, AttributeError):
+        return PollingWatcher()
+
+
 @add_metaclass(ABCMeta)
 class ReadmeReader(object):
     """
@@ -72,6 +230,67 @@ class ReadmeReader(object):
         """
         return None
 
+    def watch(self, subpath=None):
+        """
+        Returns a watch on the Readme or specified subpath to use as a
+        context manager and to pass to wait_for_change, so that waiting
+        for changes repeatedly doesn't set up a new watch every time.
+
+        Override to watch for change notifications instead of the
+        default behavior of polling.
+        """
+        return PollingWatcher().watch(None)
+
+    def wait_for_change(self, subpath=None, last_updated=None,
+                        timeout=None, watch=None):
+        """
+        Blocks until the last_updated value of the Readme or specified
+        subpath differs from the given one, or until timeout seconds
+        have passed, and returns the current last_updated value.
+
+        Set watch to a watch returned by watch() for the same subpath to
+        wait on it, otherwise one is set up for this call only.
+        """
+        if watch is None:
+            with self.watch(subpath) as watch:
+                return self._wait_for_change(
+                    watch, subpath, last_updated, timeout)
+        return self._wait_for_change(watch, subpath, last_updated, timeout)
+
+    def _wait_for_change(self, watch, subpath, last_updated, timeout):
+        """
+        Helper that waits for a change using the specified watch.
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        while True:
+            # The watch is already set up, so changes made between this
+            # check and the wait are still reported by the wait
+            updated = self.last_updated(subpath)
+            if updated != last_updated:
+                return updated
+            remaining = (deadline - time.time()
+                         if deadline is not None else None)
+            if remaining is not None and remaining <= 0:
+                return updated
+            watch.wait(remaining)
+
+    def size(self, subpath=None):
+        """
+        Returns the size in bytes of the Readme or specified subpath, or
+        None if the reader doesn't know it without reading the content.
+        """
+        return None
+
+    def iter_lines(self, subpath=None):
+        """
+        Yields the lines of the UTF-8 content of the specified subpath.
+
+        Override to read the content lazily instead of the default
+        behavior of reading it all at once.
+        """
+        for line in self.read(subpath).splitlines(True):
+            yield line
+
     @abstractmethod
     def read(self, subpath=None):
         """
@@ -84,12 +303,18 @@ class ReadmeReader(object):
 class DirectoryReader(ReadmeReader):
     """
     Reads Readme files from URL subpaths.
+
+    Set watcher to a PollingWatcher or InotifyWatcher to choose how file
+    changes are detected, otherwise the best available one is used.
     """
-    def __init__(self, path=None, silent=False):
+    def __init__(self, path=None, silent=False, watcher=None):
+        if watcher is None:
+            watcher = default_watcher()
         super(DirectoryReader, self).__init__()
         root_filename = os.path.abspath(self._resolve_readme(path, silent))
         self.root_filename = root_filename
         self.root_directory = os.path.dirname(root_filename)
+        self.watcher = watcher
 
     def _find_file(self, path, silent=False):
         """
@@ -245,6 +470,62 @@ class DirectoryReader(ReadmeReader):
                 return None
             raise
 
+    def size(self, subpath=None):
+        """
+        Returns the size in bytes of the Readme or specified subpath, or
+        None if the file does not exist.
+
+        Raises werkzeug.exceptions.NotFound if the resulting path
+        would fall out of the root directory.
+        """
+        try:
+            return os.path.getsize(self.readme_for(subpath))
+        except ReadmeNotFoundError:
+            return None
+        # OSError for Python 3 base class, EnvironmentError for Python 2
+        except (OSError, EnvironmentError) as ex:
+            if ex.errno == errno.ENOENT:
+                return None
+            raise
+
+    def iter_lines(self, subpath=None):
+        """
+        Yields the lines of the UTF-8 content of the specified subpath,
+        reading the file as the lines are consumed.
+
+        Raises ReadmeNotFoundError if a README for the specified subpath
+        does not exist.
+
+        Raises werkzeug.exceptions.NotFound if the resulting path
+        would fall out of the root directory.
+        """
+        filename = self.readme_for(subpath)
+        try:
+            f = io.open(filename, 'rt', encoding='utf-8')
+        # OSError for Python 3 base class, EnvironmentError for Python 2
+        except (OSError, EnvironmentError) as ex:
+            if ex.errno == errno.ENOENT:
+                raise ReadmeNotFoundError(filename)
+            raise
+        with f:
+            for line in f:
+                yield line
+
+    def watch(self, subpath=None):
+        """
+        Returns a watch on the Readme or specified subpath from this
+        reader's watcher, to use as a context manager and to pass to
+        wait_for_change.
+
+        Raises werkzeug.exceptions.NotFound if the resulting path
+        would fall out of the root directory.
+        """
+        try:
+            filename = self.readme_for(subpath)
+        except ReadmeNotFoundError as ex:
+            filename = ex.filename
+        return self.watcher.watch(filename)
+
     def read(self, subpath=None):
         """
         Returns the UTF-8 content of the specified subpath.
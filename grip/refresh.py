@@ -0,0 +1,212 @@
+from __future__ import print_function, unicode_literals
+
+import sys
+import threading
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+from .exceptions import ReadmeNotFoundError
+
+
+class RefreshSubscription(object):
+    """
+    A subscriber's queue of refresh events for a single subpath.
+
+    A None event indicates that no further events will be published.
+    """
+    def __init__(self, subpath):
+        super(RefreshSubscription, self).__init__()
+        self.subpath = subpath
+        self._events = Queue()
+
+    def publish(self, event):
+        """
+        Adds the specified event to the subscriber's queue.
+        """
+        self._events.put(event)
+
+    def get(self, timeout=None):
+        """
+        Returns the next event, or raises queue.Empty if there were no
+        events published within the specified timeout.
+        """
+        return self._events.get(timeout=timeout)
+
+
+class RefreshHub(object):
+    """
+    Watches each subscribed subpath with a single thread. Changes are
+    read and rendered once and then published to every subscriber.
+
+    The render argument is called as render(subpath, text) and returns
+    the rendered content. Watchers wait on the reader for up to timeout
+    seconds at a time before checking whether they should exit.
+
+    Changes are only rendered once the file has stayed unchanged for
+    debounce seconds, and renders that are superseded by a newer change
+    while in flight are dropped instead of published.
+
+    Set preview to a function called like render that returns a quick
+    provisional render, or None to skip it. Previews are published with
+    a 'preview' flag before the render is started.
+    """
+    def __init__(self, reader, render, quiet=None, timeout=None,
+                 debounce=None, preview=None):
+        if timeout is None:
+            timeout = 1.0
+        if debounce is None:
+            debounce = 0.1
+        super(RefreshHub, self).__init__()
+        self.reader = reader
+        self.render = render
+        self.preview = preview
+        self.quiet = quiet
+        self.timeout = timeout
+        self.debounce = debounce
+        self._watchers = {}
+        self._lock = threading.Lock()
+
+    def _publish(self, watcher, event):
+        with self._lock:
+            subscriptions = list(watcher.subscriptions)
+        for subscription in subscriptions:
+            subscription.publish(event)
+
+    def _close(self, watcher):
+        with self._lock:
+            if self._watchers.get(watcher.subpath) is watcher:
+                del self._watchers[watcher.subpath]
+            subscriptions = list(watcher.subscriptions)
+            watcher.subscriptions[:] = []
+        for subscription in subscriptions:
+            subscription.publish(None)
+
+    def _is_watched(self, watcher):
+        with self._lock:
+            return bool(watcher.subscriptions)
+
+    def _debounce(self, subpath, last_updated, watch):
+        while self.debounce:
+            updated = self.reader.wait_for_change(
+                subpath, last_updated, self.debounce, watch)
+            if updated == last_updated:
+                break
+            last_updated = updated
+        return last_updated
+
+    def _watch(self, watcher):
+        subpath = watcher.subpath
+        filename = self.reader.filename_for(subpath)
+        last_updated = watcher.last_updated
+        is_updating = False
+        watch = None
+        try:
+            # Keep one watch open so waits don't set up a new one each time
+            watch = self.reader.watch(subpath)
+            while self._is_watched(watcher):
+                if watcher.cancel_event and watcher.cancel_event.is_set():
+                    return
+
+                # Wait for update
+                updated = self.reader.wait_for_change(
+                    subpath, last_updated, self.timeout, watch)
+                if updated == last_updated:
+                    continue
+                # Notify subscribers that a refresh is in progress
+                if not is_updating:
+                    if not self.quiet:
+                        print(' * Change detected in {0}, refreshing'
+                              .format(filename))
+                    self._publish(watcher, {'updating': True})
+                    is_updating = True
+                # Wait for bursts of writes to settle before rendering
+                last_updated = self._debounce(subpath, updated, watch)
+                # Binary assets not supported
+                if self.reader.is_binary(subpath):
+                    return
+                # Read the Readme text
+                try:
+                    text = self.reader.read(subpath)
+                except ReadmeNotFoundError:
+                    return
+                # Publish a quick preview while the render is in flight
+                if self.preview is not None:
+                    try:
+                        content = self.preview(subpath, text)
+                    except Exception as ex:
+                        print(' * Error: could not preview {0}:'
+                              .format(filename), ex, file=sys.stderr)
+                        content = None
+                    if content is not None:
+                        self._publish(
+                            watcher, {'content': content, 'preview': True})
+                # Render once for all subscribers
+                try:
+                    content = self.render(subpath, text)
+                except Exception as ex:
+                    print(' * Error: could not refresh {0}:'.format(filename),
+                          ex, file=sys.stderr)
+                    return
+                # Drop the render if it was superseded by a newer change
+                if self.reader.last_updated(subpath) != last_updated:
+                    continue
+                self._publish(watcher, {'content': content})
+                is_updating = False
+        finally:
+            if watch is not None:
+                watch.close()
+            self._close(watcher)
+
+    def subscribe(self, subpath, cancel_event=None):
+        """
+        Returns a new subscription to the refresh events of the specified
+        subpath, starting a watcher thread for it if there isn't one. Set
+        cancel_event to stop watching.
+        """
+        subscription = RefreshSubscription(subpath)
+        with self._lock:
+            watcher = self._watchers.get(subpath)
+            is_new = watcher is None
+            if is_new:
+                watcher = _Watcher(subpath, cancel_event)
+                self._watchers[subpath] = watcher
+            watcher.subscriptions.append(subscription)
+        if is_new:
+            # Compare against the state at subscription time
+            watcher.last_updated = self.reader.last_updated(subpath)
+            watcher.thread = threading.Thread(
+                target=self._watch, args=(watcher,))
+            watcher.thread.daemon = True
+            watcher.thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """
+        Removes the specified subscription. The subpath's watcher thread
+        exits once it has no more subscribers.
+        """
+        with self._lock:
+            watcher = self._watchers.get(subscription.subpath)
+            if watcher and subscription in watcher.subscriptions:
+                watcher.subscriptions.remove(subscription)
+                if not watcher.subscriptions:
+                    del self._watchers[subscription.subpath]
+
+    def subscriber_count(self, subpath=None):
+        """
+        Returns the number of subscribers of the specified subpath.
+        """
+        with self._lock:
+            watcher = self._watchers.get(subpath)
+            return len(watcher.subscriptions) if watcher else 0
+
+
+class _Watcher(object):
+    def __init__(self, subpath, cancel_event=None):
+        self.subpath = subpath
+        self.cancel_event = cancel_event
+        self.subscriptions = []
+        self.last_updated = None
+        self.thread = None
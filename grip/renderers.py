@@ -1,18 +1,33 @@
 from __future__ import print_function, unicode_literals
 
 import json
+import multiprocessing
+import re
 import sys
+import threading
+import uuid
 from abc import ABCMeta, abstractmethod
 
 import requests
 
+try:
+    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures.process import BrokenProcessPool
+except ImportError:
+    ProcessPoolExecutor = BrokenProcessPool = None
+
 try:
     import markdown
+    from .highlight import HighlightCache, HighlightExtension
     from .vendor.mdx_urlize import UrlizeExtension
 except ImportError:
     markdown = None
-    UrlizeExtension = None
+    HighlightCache = HighlightExtension = UrlizeExtension = None
 
+from . import __version__
+from .blocks import iter_blocks, split_blocks
+from .breaker import CircuitBreaker
+from .cache import RenderCache
 from .constants import DEFAULT_API_URL
 from .patcher import patch
 from .vendor.six import add_metaclass
@@ -37,18 +52,42 @@ class ReadmeRenderer(object):
         """
         pass
 
+    def start(self):
+        """
+        Prepares the renderer ahead of its first render.
+
+        Override to start resources like worker processes early instead
+        of the default behavior of doing nothing.
+        """
+        pass
+
+    def close(self):
+        """
+        Releases the renderer's resources, like worker processes.
+        """
+        pass
+
 
 class GitHubRenderer(ReadmeRenderer):
     """
     Renders the specified Readme using the GitHub Markdown API.
+
+    Set cache to a RenderCache to skip the request when the same content
+    has already been rendered. Set session to a requests session to reuse
+    its connections, otherwise each render opens a new connection. Set
+    rate_limiter to a RateLimiter to schedule renders within the API rate
+    limit.
     """
     def __init__(self, user_content=None, context=None, api_url=None,
-                 raw=None):
+                 raw=None, cache=None, session=None, rate_limiter=None):
         if api_url is None:
             api_url = DEFAULT_API_URL
         super(GitHubRenderer, self).__init__(user_content, context)
         self.api_url = api_url
         self.raw = raw
+        self.cache = cache
+        self.session = session
+        self.rate_limiter = rate_limiter
 
     def render(self, text, auth=None):
         """
@@ -75,37 +114,451 @@ class GitHubRenderer(ReadmeRenderer):
             data = text.encode('utf-8')
             headers = {'content-type': 'text/x-markdown; charset=UTF-8'}
 
-        r = requests.post(url, headers=headers, data=data, auth=auth)
+        # Skip the request if this exact content was already rendered
+        if self.cache is not None:
+            key = self.cache.key(
+                text, 'gfm' if self.user_content else 'markdown',
+                self.context, self.api_url, bool(self.raw), __version__)
+            content = self.cache.get(key)
+            if content is not None:
+                return content
+
+        session = self.session if self.session is not None else requests
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            r = session.post(url, headers=headers, data=data, auth=auth)
+            if self.rate_limiter is None or not self.rate_limiter.update(r):
+                break
         r.raise_for_status()
 
         # FUTURE: Remove this once GitHub API properly handles Unicode markdown
         r.encoding = 'utf-8'
 
-        return r.text if self.raw else patch(r.text)
+        content = r.text if self.raw else patch(r.text)
+        if self.cache is not None:
+            self.cache.set(key, content)
+        return content
 
 
 class OfflineRenderer(ReadmeRenderer):
     """
     Renders the specified Readme locally using pure Python.
 
+    Configured Markdown instances are reset and kept in a pool of up to
+    pool_size instances after each render, so concurrent renders don't
+    set up the extensions again every time.
+
+    Fenced code is highlighted through highlight_cache, a HighlightCache,
+    so code blocks that didn't change aren't highlighted again.
+
     Note: This is currently an incomplete feature.
     """
-    def __init__(self, user_content=None, context=None):
+    def __init__(self, user_content=None, context=None, pool_size=None,
+                 highlight_cache=None):
+        if pool_size is None:
+            pool_size = 4
+        if highlight_cache is None and HighlightCache is not None:
+            highlight_cache = HighlightCache()
         super(OfflineRenderer, self).__init__(user_content, context)
+        self.pool_size = pool_size
+        self.highlight_cache = highlight_cache
+        self._engines = []
+        self._lock = threading.Lock()
 
-    def render(self, text, auth=None):
-        """
-        Renders the specified markdown content and embedded styles.
-        """
-        if markdown is None:
-            import markdown
-        if UrlizeExtension is None:
-            from .mdx_urlize import UrlizeExtension
-        return markdown.markdown(text, extensions=[
+    def _create_engine(self):
+        return markdown.Markdown(extensions=[
             'fenced_code',
-            'codehilite(css_class=highlight)',
+            'codehilite',
             'toc',
             'tables',
             'sane_lists',
+            HighlightExtension(self.highlight_cache),
             UrlizeExtension(),
-        ])
+        ], extension_configs={
+            'codehilite': {'css_class': 'highlight'},
+        })
+
+    def _acquire_engine(self):
+        with self._lock:
+            if self._engines:
+                return self._engines.pop()
+        return self._create_engine()
+
+    def _release_engine(self, engine):
+        engine.reset()
+        with self._lock:
+            if len(self._engines) < self.pool_size:
+                self._engines.append(engine)
+
+    def render(self, text, auth=None):
+        """
+        Renders the specified markdown content and embedded styles.
+        """
+        if markdown is None:
+            raise ImportError(
+                'Python-Markdown is required to render offline.')
+        engine = self._acquire_engine()
+        try:
+            return engine.convert(text)
+        finally:
+            self._release_engine(engine)
+
+    def render_stream(self, lines, chunk_size=None):
+        """
+        Renders the specified markdown lines in chunks of top-level blocks
+        of about chunk_size characters, yielding the content of each chunk
+        as soon as it's rendered.
+
+        Only the current chunk is held in memory. Reference link
+        definitions apply to the chunk they're in and every later chunk.
+        """
+        if chunk_size is None:
+            chunk_size = 64 * 1024
+        definitions = []
+        chunk = []
+        size = 0
+        for kind, block in iter_blocks(lines):
+            if kind == 'definition':
+                definitions.append(block)
+                continue
+            chunk.append(block)
+            size += len(block)
+            if size >= chunk_size:
+                yield self._render_chunk(chunk, definitions)
+                chunk = []
+                size = 0
+        if chunk:
+            yield self._render_chunk(chunk, definitions)
+
+    def _render_chunk(self, blocks, definitions):
+        text = '\n\n'.join(blocks)
+        if definitions:
+            text += '\n\n' + '\n'.join(definitions)
+        return self.render(text)
+
+
+# The renderer of the current worker process of a ProcessPoolRenderer
+_worker_renderer = None
+
+
+def _init_worker(user_content, context):
+    global _worker_renderer
+    _worker_renderer = OfflineRenderer(user_content, context)
+    # Warm up the imports, extensions, and lexers before the first render
+    _worker_renderer.render('# Grip\n\n```python\nimport grip\n```\n')
+
+
+def _render_in_worker(text):
+    return _worker_renderer.render(text)
+
+
+def _start_worker():
+    # Submitted to make the pool start a worker, which warms up as it starts
+    pass
+
+
+class ProcessPoolRenderer(OfflineRenderer):
+    """
+    Renders the specified Readme locally in a pool of max_workers worker
+    processes, so concurrent renders aren't serialized by the GIL.
+
+    Workers are started and warmed up by start(), or otherwise on the
+    first render. Up to max_pending renders wait for a free worker, after
+    which further renders block until one finishes. Call close() to stop
+    the workers.
+    """
+    def __init__(self, user_content=None, context=None, max_workers=None,
+                 max_pending=None):
+        if max_workers is None:
+            max_workers = multiprocessing.cpu_count()
+        if max_pending is None:
+            max_pending = max_workers * 2
+        super(ProcessPoolRenderer, self).__init__(user_content, context)
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                if ProcessPoolExecutor is None:
+                    raise ImportError(
+                        'concurrent.futures is required to render in '
+                        'worker processes.')
+                self._executor = ProcessPoolExecutor(
+                    self.max_workers, initializer=_init_worker,
+                    initargs=(self.user_content, self.context))
+            return self._executor
+
+    def start(self):
+        """
+        Starts the worker processes, which warm up in the background.
+        """
+        executor = self._get_executor()
+        for _ in range(self.max_workers):
+            executor.submit(_start_worker)
+
+    def _discard_executor(self, executor):
+        # Stops using a pool that's broken, so the next render starts anew
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def _render_with(self, executor, text):
+        self._slots.acquire()
+        try:
+            future = executor.submit(_render_in_worker, text)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda future: self._slots.release())
+        return future.result()
+
+    def render(self, text, auth=None):
+        """
+        Renders the specified markdown content in a worker process.
+
+        If a worker died, like from running out of memory, the render is
+        retried once in a new pool of workers.
+        """
+        for is_retry in [False, True]:
+            executor = self._get_executor()
+            try:
+                return self._render_with(executor, text)
+            except BrokenProcessPool:
+                self._discard_executor(executor)
+                if is_retry:
+                    raise
+
+    def close(self):
+        """
+        Stops the worker processes.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+
+class WrappingRenderer(ReadmeRenderer):
+    """
+    Base class for renderers that add behavior around the specified
+    renderer. The wrapped renderer's attributes, like its rate limiter,
+    are exposed as the wrapper's own.
+    """
+    def __init__(self, renderer):
+        super(WrappingRenderer, self).__init__(
+            renderer.user_content, renderer.context)
+        self.renderer = renderer
+
+    def __getattr__(self, name):
+        # Only called for missing attributes, so don't recurse when the
+        # wrapped renderer isn't set yet, like while unpickling
+        if name == 'renderer':
+            raise AttributeError(name)
+        return getattr(self.renderer, name)
+
+    def start(self):
+        """
+        Prepares the wrapped renderer ahead of its first render.
+        """
+        self.renderer.start()
+
+    def close(self):
+        """
+        Releases the wrapped renderer's resources.
+        """
+        self.renderer.close()
+
+
+class IncrementalRenderer(WrappingRenderer):
+    """
+    Renders large Readmes block by block using the specified renderer.
+
+    The Readme is split into top-level blocks and each block's rendered
+    content is cached by a hash of its text. Only the blocks that aren't
+    cached are sent to the wrapped renderer, in a single render, so the
+    cost of a re-render grows with the size of the edit instead of the
+    size of the document.
+
+    Note: Blocks are rendered separately, so headers repeated across
+    blocks may get the same anchors and footnotes are not supported.
+    """
+    def __init__(self, renderer, cache=None):
+        if cache is None:
+            cache = RenderCache(max_size=4096)
+        super(IncrementalRenderer, self).__init__(renderer)
+        self.block_cache = cache
+
+    def _block_key(self, block, definitions):
+        return self.block_cache.key(
+            block, definitions, type(self.renderer).__name__,
+            self.renderer.user_content, self.renderer.context,
+            getattr(self.renderer, 'api_url', None),
+            getattr(self.renderer, 'raw', None), __version__)
+
+    def render(self, text, auth=None):
+        """
+        Renders the specified markdown content, rendering only the
+        blocks that changed since they were last rendered.
+        """
+        blocks, definitions = split_blocks(text)
+        definitions = '\n'.join(definitions)
+        keys = [self._block_key(block, definitions) for block in blocks]
+
+        rendered = {}
+        missing = []
+        for key, block in zip(keys, blocks):
+            if key in rendered:
+                continue
+            content = self.block_cache.get(key)
+            if content is None:
+                missing.append((key, block))
+            rendered[key] = content
+
+        if missing:
+            # Render every changed block at once, separated by a marker
+            # paragraph that can be found in the rendered content
+            marker = 'grip-block-{0}'.format(uuid.uuid4().hex)
+            source = '\n\n{0}\n\n'.format(marker).join(
+                block for _, block in missing)
+            if definitions:
+                source += '\n\n' + definitions
+            content = self.renderer.render(source, auth)
+            parts = re.split(
+                r'\s*<p[^>]*>{0}</p>\s*'.format(marker), content.strip())
+            # Fall back to the whole document if the markers were mangled
+            if len(parts) != len(missing):
+                return self.renderer.render(text, auth)
+            for (key, _), part in zip(missing, parts):
+                self.block_cache.set(key, part)
+                rendered[key] = part
+
+        return '\n'.join(rendered[key] for key in keys)
+
+
+class HybridRenderer(WrappingRenderer):
+    """
+    Renders the Readme with the specified renderer, usually a
+    GitHubRenderer, and provides a fast local preview while it renders.
+
+    render() returns the accurate content of the wrapped renderer, and
+    render_preview() returns the content of preview_renderer, which is an
+    OfflineRenderer by default. The app serves the preview first and then
+    replaces it with the accurate content once it arrives.
+    """
+    def __init__(self, renderer, preview_renderer=None):
+        if preview_renderer is None:
+            preview_renderer = OfflineRenderer(
+                renderer.user_content, renderer.context)
+        super(HybridRenderer, self).__init__(renderer)
+        self.preview_renderer = preview_renderer
+
+    def start(self):
+        """
+        Prepares the wrapped and preview renderers ahead of their first
+        render.
+        """
+        super(HybridRenderer, self).start()
+        self.preview_renderer.start()
+
+    def close(self):
+        """
+        Releases the wrapped and preview renderers' resources.
+        """
+        super(HybridRenderer, self).close()
+        self.preview_renderer.close()
+
+    def render(self, text, auth=None):
+        """
+        Renders the specified markdown content with the accurate renderer.
+        """
+        return self.renderer.render(text, auth)
+
+    def render_preview(self, text, auth=None):
+        """
+        Renders the specified markdown content with the preview renderer.
+        """
+        return self.preview_renderer.render(text, auth)
+
+
+class FallbackRenderer(WrappingRenderer):
+    """
+    Renders the Readme with the specified renderer, usually a
+    GitHubRenderer, and falls back to fallback_renderer, an
+    OfflineRenderer by default, when the API is unreachable, times out,
+    or fails with a server error.
+
+    Failures are recorded by breaker, a CircuitBreaker. While it's open,
+    renders go straight to the fallback renderer instead of waiting on
+    the API. Fallback renders start with a banner naming the renderer
+    that produced them.
+    """
+    def __init__(self, renderer, fallback_renderer=None, breaker=None):
+        if fallback_renderer is None:
+            fallback_renderer = OfflineRenderer(
+                renderer.user_content, renderer.context)
+        if breaker is None:
+            breaker = CircuitBreaker()
+        super(FallbackRenderer, self).__init__(renderer)
+        self.fallback_renderer = fallback_renderer
+        self.breaker = breaker
+
+    def start(self):
+        """
+        Prepares the wrapped and fallback renderers ahead of their first
+        render.
+        """
+        super(FallbackRenderer, self).start()
+        self.fallback_renderer.start()
+
+    def close(self):
+        """
+        Releases the wrapped and fallback renderers' resources.
+        """
+        super(FallbackRenderer, self).close()
+        self.fallback_renderer.close()
+
+    def _is_upstream_error(self, ex):
+        if isinstance(ex, requests.HTTPError):
+            return (ex.response is not None and
+                    ex.response.status_code >= 500)
+        return isinstance(ex, (requests.ConnectionError, requests.Timeout))
+
+    def _render_fallback(self, text, auth=None):
+        content = self.fallback_renderer.render(text, auth)
+        banner = (
+            '<div class="grip-renderer-banner">Rendered by {0} because '
+            '{1} is unavailable.</div>'.format(
+                type(self.fallback_renderer).__name__,
+                getattr(self.renderer, 'api_url', None) or 'the API'))
+        return banner + '\n' + content
+
+    def is_fallback(self, content):
+        """
+        Returns whether the specified content was rendered by the
+        fallback renderer.
+        """
+        return content.startswith('<div class="grip-renderer-banner">')
+
+    def render(self, text, auth=None):
+        """
+        Renders the specified markdown content, falling back to the
+        fallback renderer while the API is unavailable.
+        """
+        if not self.breaker.allow():
+            return self._render_fallback(text, auth)
+        try:
+            content = self.renderer.render(text, auth)
+        except Exception as ex:
+            if not self._is_upstream_error(ex):
+                # The API is reachable, so only the request was at fault
+                self.breaker.record_success()
+                raise
+            self.breaker.record_failure()
+            return self._render_fallback(text, auth)
+        self.breaker.record_success()
+        return content
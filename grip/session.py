@@ -0,0 +1,49 @@
+from __future__ import print_function, unicode_literals
+
+import requests
+from requests.adapters import HTTPAdapter
+try:
+    from urllib3.util.retry import Retry
+except ImportError:
+    from requests.packages.urllib3.util.retry import Retry
+
+
+class PooledSession(requests.Session):
+    """
+    A requests session that keeps connections alive in a pool, retries
+    failed connections, and applies a default timeout to each request.
+
+    This is shared by the renderer and asset manager so repeated renders
+    and downloads reuse the same TCP and TLS connections.
+    """
+    def __init__(self, pool_size=None, retries=None, timeout=None):
+        if pool_size is None:
+            pool_size = 10
+        if retries is None:
+            retries = 2
+        super(PooledSession, self).__init__()
+        self.pool_size = pool_size
+        self.retries = retries
+        self.timeout = timeout
+
+        # Rendering is idempotent, so retry POST requests too
+        # (urllib3 1.26 renamed method_whitelist to allowed_methods)
+        methods_option = ('allowed_methods'
+                          if hasattr(Retry, 'DEFAULT_ALLOWED_METHODS')
+                          else 'method_whitelist')
+        max_retries = Retry(
+            total=retries, backoff_factor=0.3,
+            status_forcelist=(502, 503, 504), raise_on_status=False,
+            **{methods_option: None})
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size,
+            max_retries=max_retries)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def request(self, method, url, **kwargs):
+        """
+        Sends the request, using the session timeout if one isn't given.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        return super(PooledSession, self).request(method, url, **kwargs)
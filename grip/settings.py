@@ -12,7 +12,34 @@ PORT = 6419
 DEBUG = False
 DEBUG_GRIP = False
 CACHE_DIRECTORY = 'cache-{version}'
+# Download and inline styles and fonts in up to this many threads
+ASSET_WORKERS = 8
+RENDER_CACHE_DIRECTORY = 'render-cache-{version}'
+RENDER_CACHE_SIZE = 128
+RENDER_CACHE_DISK_SIZE = 1024
+# Only render the blocks of a Readme that changed since the last render
+RENDER_INCREMENTAL = False
+# Serve a local Python-Markdown preview until GitHub's render arrives
+RENDER_HYBRID = False
+# Render offline in this many worker processes instead of in the server
+# threads, queueing up to RENDER_MAX_PENDING renders (twice as many if None)
+RENDER_PROCESSES = 0
+RENDER_MAX_PENDING = None
+# Stream Readmes of at least this many bytes in chunks as they're rendered
+# when the renderer supports it, like the offline renderer
+RENDER_STREAM_THRESHOLD = 10 * 1024 * 1024
+# Render offline while the GitHub API is unavailable, and stop trying it
+# for CIRCUIT_BREAKER_RESET_TIMEOUT seconds after repeated failures
+RENDER_FALLBACK = True
+CIRCUIT_BREAKER_MAX_FAILURES = 3
+CIRCUIT_BREAKER_RESET_TIMEOUT = 30.0
 AUTOREFRESH = True
+# Seconds a file must stay unchanged before it's refreshed
+AUTOREFRESH_DEBOUNCE = 0.1
+# Serve the last render right away and refresh it once rendered, if the
+# render takes more than STALE_WHILE_REVALIDATE_WAIT seconds
+STALE_WHILE_REVALIDATE = False
+STALE_WHILE_REVALIDATE_WAIT = 0.05
 QUIET = False
 
 
@@ -21,11 +48,37 @@ QUIET = False
 # https://github.com/settings/tokens/new?scopes=
 USERNAME = None
 PASSWORD = None
+# Personal access tokens to rotate between, e.g. for a shared preview server
+TOKENS = []
 
 
 # Custom GitHub API
 API_URL = None
 
 
+# HTTP connection pooling for requests to GitHub
+HTTP_POOL_SIZE = 10
+HTTP_RETRIES = 2
+# Seconds, or a (connect, read) tuple, to wait before giving up on a request
+HTTP_TIMEOUT = (3.05, 30)
+
+
+# Compress pages, cached styles and the autorefresh stream with gzip, or
+# brotli when the brotli package is installed, for clients that accept it
+COMPRESSION = True
+# The gzip (1-9) or brotli (0-11) level, or None for a fast default
+COMPRESSION_LEVEL = None
+# Send smaller responses as is
+COMPRESSION_MIN_SIZE = 1024
+
+
+# Rate limit scheduling for background renders, like autorefresh
+RATE_LIMIT_RESERVE = 10
+RATE_LIMIT_BURST = 5
+RATE_LIMIT_BACKOFF = 1.0
+RATE_LIMIT_MAX_BACKOFF = 60.0
+RATE_LIMIT_MAX_RETRIES = 3
+
+
 # Custom styles
 STYLE_URLS = []
@@ -0,0 +1,66 @@
+"""
+Benchmarks Grip's HTML patcher against the regex chain it replaced.
+
+Run with: python tests/benchmark.py
+"""
+
+from __future__ import print_function, unicode_literals
+
+import os
+import re
+import sys
+import timeit
+
+DIRNAME = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(1, os.path.dirname(DIRNAME))
+
+from grip.patcher import patch  # noqa: E402
+
+
+INCOMPLETE_TASK_RE = re.compile(r'<li>\[ \] (.*?)(<ul.*?>|</li>)', re.DOTALL)
+INCOMPLETE_TASK_SUB = (r'<li class="task-list-item">'
+                       r'<input type="checkbox" '
+                       r'class="task-list-item-checkbox" disabled=""> \1\2')
+COMPLETE_TASK_RE = re.compile(r'<li>\[x\] (.*?)(<ul.*?>|</li>)', re.DOTALL)
+COMPLETE_TASK_SUB = (r'<li class="task-list-item">'
+                     r'<input type="checkbox" class="task-list-item-checkbox" '
+                     r'checked="" disabled=""> \1\2')
+HEADER_PATCH_RE = re.compile(r'<span>{:"aria-hidden"=&gt;"true", :class=&gt;'
+                             r'"octicon octicon-link"}</span>', re.DOTALL)
+HEADER_PATCH_SUB = r'<span class="octicon octicon-link"></span>'
+
+
+def regex_patch(html):
+    """
+    The regex chain that grip.patcher.patch used before.
+    """
+    html = INCOMPLETE_TASK_RE.sub(INCOMPLETE_TASK_SUB, html)
+    html = COMPLETE_TASK_RE.sub(COMPLETE_TASK_SUB, html)
+    return HEADER_PATCH_RE.sub(HEADER_PATCH_SUB, html)
+
+
+def task_list(items, text_length=200):
+    text = 'Lorem ipsum dolor sit amet ' * (text_length // 27 + 1)
+    return '<ul>\n{0}</ul>\n'.format(''.join(
+        '<li>[{0}] {1}<em>{2}</em></li>\n'.format(
+            'x' if index % 2 else ' ', text[:text_length], index)
+        for index in range(items)))
+
+
+def benchmark(name, html, number=5):
+    assert patch(html) == regex_patch(html)
+    for label, func in [('regex', regex_patch), ('single-pass', patch)]:
+        seconds = min(timeit.repeat(
+            lambda: func(html), number=number, repeat=3)) / number
+        print('{0:<32} {1:<12} {2:>10.2f} ms'.format(
+            name, label, seconds * 1000))
+
+
+def main():
+    for items in [1000, 10000, 50000]:
+        benchmark('{0} task items'.format(items), task_list(items))
+    benchmark('1000 long task items', task_list(1000, 20000))
+
+
+if __name__ == '__main__':
+    main()
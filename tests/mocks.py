@@ -1,10 +1,13 @@
 from __future__ import print_function, unicode_literals
 
 import json
+import time
 
 import requests
 import responses
-from grip import DEFAULT_API_URL, GitHubAssetManager, Grip, StdinReader
+from grip import (
+    DEFAULT_API_URL, GitHubAssetManager, Grip, PooledSession, ReadmeRenderer,
+    StdinReader)
 
 from helpers import USER_CONTEXT, input_file, output_file
 
@@ -91,6 +94,39 @@ class GitHubRequestsMock(responses.RequestsMock):
             self._decode_body(request)))
 
 
+class PooledSessionMock(PooledSession):
+    def __init__(self, *args, **kwargs):
+        super(PooledSessionMock, self).__init__(*args, **kwargs)
+        self.request_calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.request_calls += 1
+        return super(PooledSessionMock, self).request(method, url, **kwargs)
+
+
+class ParagraphRendererMock(ReadmeRenderer):
+    """
+    Renders each blank-line separated paragraph, ignoring reference link
+    definitions, and records the text of every render. Set delay to make
+    each render take that many seconds, and attrs to add attributes to
+    each paragraph, like GitHub's dir="auto".
+    """
+    def __init__(self, *args, **kwargs):
+        self.delay = kwargs.pop('delay', None)
+        self.attrs = kwargs.pop('attrs', '')
+        super(ParagraphRendererMock, self).__init__(*args, **kwargs)
+        self.rendered = []
+
+    def render(self, text, auth=None):
+        self.rendered.append(text)
+        if self.delay:
+            time.sleep(self.delay)
+        return '\n'.join(
+            '<p{0}>{1}</p>'.format(self.attrs, paragraph.strip())
+            for paragraph in text.split('\n\n')
+            if paragraph.strip() and not paragraph.startswith('['))
+
+
 class StdinReaderMock(StdinReader):
     def __init__(self, mock_stdin, *args, **kwargs):
         super(StdinReaderMock, self).__init__(*args, **kwargs)
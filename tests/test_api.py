@@ -8,21 +8,38 @@ fake objects with subclasses and tests the basic expected behavior of Grip.
 
 from __future__ import print_function, unicode_literals
 
+import hashlib
+import json
 import os
 import posixpath
+import signal
+import sys
+import threading
+import time
+import zlib
 
 import pytest
+import requests
+import responses
 from requests.exceptions import HTTPError
 from werkzeug.exceptions import NotFound
 
 from helpers import USER_CONTEXT, input_file, input_filename, output_file
 from mocks import (
-    GitHubAssetManagerMock, GripMock, GitHubRequestsMock, StdinReaderMock)
+    GitHubAssetManagerMock, GripMock, GitHubRequestsMock,
+    ParagraphRendererMock, PooledSessionMock, StdinReaderMock)
 
 from grip import (
-    DEFAULT_FILENAME, DirectoryReader, GitHubAssetManager, GitHubRenderer,
-    Grip, ReadmeNotFoundError, ReadmeReader, ReadmeRenderer, TextReader,
-    create_app)
+    ASSET_MANIFEST_FILENAME, ASSET_MANIFEST_VERSION, DEFAULT_API_URL,
+    DEFAULT_FILENAME, STYLE_URLS_SOURCE, CircuitBreaker, DirectoryReader,
+    FallbackRenderer, GitHubAssetManager, GitHubRenderer, Grip, HighlightCache,
+    HybridRenderer, IncrementalRenderer, InotifyWatcher, OfflineRenderer,
+    Patcher, PollingWatcher, PooledSession, ProcessPoolRenderer, RateLimiter,
+    ReadmeNotFoundError, ReadmeReader, ReadmeRenderer, RefreshHub, RenderCache,
+    SingleFlight, TextReader, TokenPool, UsedSelectors, create_app,
+    default_watcher, export, prune_css, render_page, split_blocks)
+from grip.compression import compress_stream, precompress
+from grip.patcher import default_patcher, patch
 
 
 # TODO: Test DEFAULT_API_URL, DEFAULT_FILENAMES, DEFAULT_GRIPHOME,
@@ -126,6 +143,55 @@ def test_directory_reader():
     assert DirectoryReader(default_dir).read() is not None
 
 
+@pytest.mark.parametrize('watcher', [
+    PollingWatcher(0.01), default_watcher()])
+def test_directory_reader_wait_for_change(tmpdir, watcher):
+    readme = tmpdir.join(DEFAULT_FILENAME)
+    readme.write_text('Before', 'utf-8')
+    reader = DirectoryReader(str(tmpdir), watcher=watcher)
+    assert reader.watcher is watcher
+    last_updated = reader.last_updated()
+
+    assert reader.wait_for_change(None, last_updated, 0.05) == last_updated
+    assert reader.wait_for_change(None, None, 0.05) == last_updated
+
+    def touch():
+        time.sleep(0.1)
+        readme.write_text('After', 'utf-8')
+        readme.setmtime(last_updated + 10)
+
+    thread = threading.Thread(target=touch)
+    thread.start()
+    assert reader.wait_for_change(None, last_updated, 5) == last_updated + 10
+    thread.join()
+
+    # A watch can be kept open across waits
+    with reader.watch() as watch:
+        assert reader.wait_for_change(
+            None, last_updated, 0.05, watch) == last_updated + 10
+        thread = threading.Thread(target=lambda: (
+            time.sleep(0.1), readme.setmtime(last_updated + 20)))
+        thread.start()
+        assert reader.wait_for_change(
+            None, last_updated + 10, 5, watch) == last_updated + 20
+        thread.join()
+
+    readme.remove()
+    assert reader.wait_for_change(None, last_updated + 20, 5) is None
+
+
+def test_default_watcher():
+    if sys.platform.startswith('linux'):
+        assert type(default_watcher()) is InotifyWatcher
+        with default_watcher().watch(input_filename('zero.md')) as watch:
+            assert watch.fd is not None
+        assert watch.fd is None
+    else:
+        assert type(default_watcher()) is PollingWatcher
+    assert type(DirectoryReader(DIRNAME, True).watcher) is type(
+        default_watcher())
+
+
 def test_text_reader():
     text = 'Test *Text*'
     filename = DEFAULT_FILENAME
@@ -219,10 +285,502 @@ def test_github_renderer():
         assert len(responses.calls) == 2
 
 
+def test_render_cache(tmpdir):
+    simple_input = input_file('simple.md')
+    simple_output = output_file('renderer', 'simple.html')
+    cache_dir = tmpdir.join('render-cache-dummy')
+
+    cache = RenderCache(str(cache_dir))
+    assert cache.key('a', None) == cache.key('a', None)
+    assert cache.key('a', None) != cache.key('a', 'b')
+    assert cache.get(cache.key('a')) is None
+    cache.set(cache.key('a'), 'A')
+    assert cache.get(cache.key('a')) == 'A'
+    assert RenderCache(str(cache_dir)).get(cache.key('a')) == 'A'
+    assert RenderCache().get(cache.key('a')) is None
+    cache.clear()
+    assert not cache_dir.check()
+    assert cache.get(cache.key('a')) is None
+
+    # The disk tier keeps the most recently used entries
+    disk_cache = RenderCache(str(cache_dir), max_size=0, max_disk_size=2)
+    for index, key in enumerate(['a', 'b', 'c']):
+        disk_cache.set(key, key.upper())
+        os.utime(str(cache_dir.join(key + '.html')), (index, index))
+    assert sorted(path.basename for path in cache_dir.listdir()) == [
+        'b.html', 'c.html']
+    assert disk_cache.get('b') == 'B'
+    disk_cache.set('d', 'D')
+    assert sorted(path.basename for path in cache_dir.listdir()) == [
+        'b.html', 'd.html']
+    cache.clear()
+
+    memory_cache = RenderCache(max_size=2)
+    memory_cache.set('a', 'A')
+    memory_cache.set('b', 'B')
+    assert memory_cache.get('a') == 'A'
+    memory_cache.set('c', 'C')
+    assert memory_cache.get('a') == 'A'
+    assert memory_cache.get('b') is None
+
+    with GitHubRequestsMock() as responses:
+        renderer = GitHubRenderer(cache=RenderCache(str(cache_dir)))
+        assert renderer.render(simple_input) == simple_output
+        assert renderer.render(simple_input) == simple_output
+        assert len(responses.calls) == 1
+        renderer = GitHubRenderer(cache=RenderCache(str(cache_dir)))
+        assert renderer.render(simple_input) == simple_output
+        assert len(responses.calls) == 1
+        renderer = GitHubRenderer(True, cache=RenderCache(str(cache_dir)))
+        assert (renderer.render(simple_input) ==
+                output_file('renderer', 'simple-user-content.html'))
+        assert len(responses.calls) == 2
+
+
+def test_pooled_session():
+    simple_input = input_file('simple.md')
+    simple_output = output_file('renderer', 'simple.html')
+
+    session = PooledSession(pool_size=4, retries=1, timeout=5)
+    assert session.pool_size == 4
+    assert session.retries == 1
+    assert session.timeout == 5
+    assert session.get_adapter(DEFAULT_API_URL).max_retries.total == 1
+
+    session = PooledSessionMock()
+    with GitHubRequestsMock() as responses:
+        renderer = GitHubRenderer(session=session)
+        assert renderer.render(simple_input) == simple_output
+        assert renderer.render(simple_input) == simple_output
+        assert len(responses.calls) == 2
+    assert session.request_calls == 2
+
+
+def test_single_flight():
+    flights = SingleFlight()
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def slow_render(text):
+        calls.append(text)
+        release.wait(5)
+        return text.upper()
+
+    def run():
+        results.append(flights.do('key', slow_render, 'text'))
+
+    threads = [threading.Thread(target=run) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert calls == ['text']
+    assert results == ['TEXT', 'TEXT', 'TEXT']
+
+    assert flights.do('key', slow_render, 'again') == 'AGAIN'
+    assert len(calls) == 2
+    with pytest.raises(ZeroDivisionError):
+        flights.do('key', lambda: 1 / 0)
+
+
+def test_refresh_hub(tmpdir):
+    readme = tmpdir.join(DEFAULT_FILENAME)
+    readme.write_text('Before', 'utf-8')
+    reader = DirectoryReader(str(tmpdir))
+    renders = []
+
+    def render(subpath, text):
+        renders.append(text)
+        return '<p>{0}</p>'.format(text)
+
+    watches = []
+    watch = reader.watch
+    reader.watch = lambda subpath=None: watches.append(subpath) or watch(
+        subpath)
+
+    hub = RefreshHub(reader, render, quiet=True, timeout=0.05)
+    first = hub.subscribe(None)
+    second = hub.subscribe(None)
+    assert hub.subscriber_count(None) == 2
+
+    readme.write_text('After', 'utf-8')
+    readme.setmtime(readme.mtime() + 10)
+    for subscription in [first, second]:
+        assert subscription.get(timeout=5) == {'updating': True}
+        assert subscription.get(timeout=5) == {'content': '<p>After</p>'}
+    assert renders == ['After']
+    # The watcher thread waits and debounces on a single watch
+    assert watches == [None]
+
+    hub.unsubscribe(first)
+    assert hub.subscriber_count(None) == 1
+    hub.unsubscribe(second)
+    assert hub.subscriber_count(None) == 0
+
+    cancel_event = threading.Event()
+    subscription = hub.subscribe(None, cancel_event)
+    cancel_event.set()
+    assert subscription.get(timeout=5) is None
+    assert hub.subscriber_count(None) == 0
+
+
+def test_refresh_hub_debounce(tmpdir):
+    readme = tmpdir.join(DEFAULT_FILENAME)
+    readme.write_text('Before', 'utf-8')
+    reader = DirectoryReader(str(tmpdir))
+    mtimes = iter(range(int(readme.mtime()) + 1, int(readme.mtime()) + 100))
+    renders = []
+
+    def write(text):
+        readme.write_text(text, 'utf-8')
+        readme.setmtime(next(mtimes))
+
+    def render(subpath, text):
+        renders.append(text)
+        # Simulate a save while the first render is in flight
+        if text == 'Burst 3':
+            write('Superseding')
+        return '<p>{0}</p>'.format(text)
+
+    hub = RefreshHub(reader, render, quiet=True, timeout=0.05, debounce=0.2)
+    subscription = hub.subscribe(None)
+    for text in ['Burst 1', 'Burst 2', 'Burst 3']:
+        write(text)
+        time.sleep(0.02)
+    assert subscription.get(timeout=5) == {'updating': True}
+    assert subscription.get(timeout=5) == {'content': '<p>Superseding</p>'}
+    assert renders == ['Burst 3', 'Superseding']
+    hub.unsubscribe(subscription)
+
+
+def _rate_limited_response(status_code=200, remaining=4999, reset=None,
+                           **headers):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers['X-RateLimit-Limit'] = '5000'
+    response.headers['X-RateLimit-Remaining'] = str(remaining)
+    response.headers['X-RateLimit-Reset'] = str(
+        reset if reset is not None else int(time.time()) + 3600)
+    response.headers.update(headers)
+    return response
+
+
+def test_rate_limiter():
+    limiter = RateLimiter(reserve=10, burst=2, backoff=0.01)
+    assert limiter.status()['remaining'] is None
+    assert not limiter.is_background
+    with limiter.background():
+        assert limiter.is_background
+        limiter.acquire()
+    assert not limiter.is_background
+
+    assert not limiter.update(_rate_limited_response())
+    status = limiter.status()
+    assert status['limit'] == 5000
+    assert status['remaining'] == 4999
+    assert status['backoff'] == 0
+
+    # Page loads can use the reserve, but background renders wait for reset
+    reset = time.time() + 0.3
+    limiter.update(_rate_limited_response(remaining=5, reset=reset))
+    limiter.acquire()
+    assert limiter.status()['remaining'] == 4
+    with limiter.background():
+        limiter.acquire()
+    assert time.time() >= reset
+
+    # Rate limited background requests are retried after backing off
+    assert not limiter.update(_rate_limited_response(403))
+    assert limiter.status()['backoff'] == 0
+    assert not limiter.update(_rate_limited_response(429))
+    assert limiter.status()['backoff'] > 0
+    assert not limiter.update(_rate_limited_response())
+    with limiter.background():
+        assert limiter.update(_rate_limited_response(403, 0))
+        assert limiter.update(_rate_limited_response(429))
+        assert limiter.update(_rate_limited_response(403, 0))
+        assert not limiter.update(_rate_limited_response(403, 0))
+
+
+def test_github_renderer_rate_limit():
+    simple_input = input_file('simple.md')
+    simple_output = output_file('renderer', 'simple.html')
+    url = '{0}/markdown/raw'.format(DEFAULT_API_URL)
+    limited_headers = {'X-RateLimit-Remaining': '0', 'Retry-After': '0'}
+
+    with responses.RequestsMock() as mock:
+        mock.add(responses.POST, url, status=429, headers=limited_headers)
+        mock.add(responses.POST, url, body=output_file('raw', 'simple.html'))
+        renderer = GitHubRenderer(rate_limiter=RateLimiter(backoff=0.01))
+        with renderer.rate_limiter.background():
+            assert renderer.render(simple_input) == simple_output
+        assert len(mock.calls) == 2
+
+    with responses.RequestsMock() as mock:
+        mock.add(responses.POST, url, status=429, headers=limited_headers)
+        renderer = GitHubRenderer(rate_limiter=RateLimiter(backoff=0.01))
+        with pytest.raises(HTTPError):
+            renderer.render(simple_input)
+        assert len(mock.calls) == 1
+
+
+def test_app_render_priority(monkeypatch, tmpdir):
+    monkeypatch.setenv('GRIPHOME', str(tmpdir))
+
+    class RateLimitedRendererMock(ParagraphRendererMock):
+        def render(self, text, auth=None):
+            self.rate_limiter.acquire()
+            return super(RateLimitedRendererMock, self).render(text, auth)
+
+    renderer = RateLimitedRendererMock()
+    renderer.rate_limiter = RateLimiter(reserve=10)
+    reset = time.time() + 1
+    renderer.rate_limiter.update(_rate_limited_response(remaining=5,
+                                                        reset=reset))
+    app = GripMock(TextReader('Text'), renderer=renderer)
+
+    # A page load doesn't join a background render waiting for the reset
+    thread = threading.Thread(
+        target=app._render_background_content, args=(None, 'Text'))
+    thread.start()
+    time.sleep(0.1)
+    assert app._render_content(None, 'Text') == '<p>Text</p>'
+    assert time.time() < reset
+    thread.join()
+    assert renderer.rendered == ['Text', 'Text']
+
+
+def test_token_pool():
+    simple_input = input_file('simple.md')
+    simple_output = output_file('renderer', 'simple.html')
+    url = '{0}/markdown/raw'.format(DEFAULT_API_URL)
+    reset = str(int(time.time()) + 3600)
+
+    def authorization(token):
+        request = requests.Request()
+        requests.auth.HTTPBasicAuth('', token)(request)
+        return request.headers['Authorization']
+
+    quotas = {authorization('exhausted'): 0, authorization('fresh'): 4000}
+
+    def markdown_raw(request):
+        remaining = quotas[request.headers['Authorization']]
+        headers = {'X-RateLimit-Limit': '5000',
+                   'X-RateLimit-Remaining': str(remaining),
+                   'X-RateLimit-Reset': reset}
+        if remaining == 0:
+            return (403, headers, '{"message":"API rate limit exceeded"}')
+        return (200, headers, output_file('raw', 'simple.html'))
+
+    pool = TokenPool(['exhausted', 'fresh'])
+    assert len(pool) == 2
+    assert pool.credentials == [('', 'exhausted'), ('', 'fresh')]
+    assert pool.select() == 0
+    assert TokenPool([('user', 'pass')]).credentials == [('user', 'pass')]
+
+    with responses.RequestsMock() as mock:
+        mock.add_callback(responses.POST, url, callback=markdown_raw)
+        renderer = GitHubRenderer(rate_limiter=RateLimiter())
+        assert renderer.render(simple_input, pool) == simple_output
+        assert len(mock.calls) == 2
+        assert (mock.calls[0].request.headers['Authorization'] ==
+                authorization('exhausted'))
+        assert (mock.calls[1].request.headers['Authorization'] ==
+                authorization('fresh'))
+
+        # The exhausted credential is skipped until it resets
+        assert pool.select() == 1
+        assert renderer.render(simple_input, pool) == simple_output
+        assert len(mock.calls) == 3
+        assert renderer.rate_limiter.status()['remaining'] == 4000
+        assert [quota['remaining'] for quota in pool.status()] == [0, 4000]
+
+    assert isinstance(create_app(grip_class=GripMock, tokens=['a']).auth,
+                      TokenPool)
+    assert isinstance(GripMock(auth=['a', 'b']).auth, TokenPool)
+
+
+def test_split_blocks():
+    text = '\n'.join([
+        '# Title',
+        '',
+        'Paragraph with a [link][ref].',
+        '',
+        '[ref]: http://example.com',
+        '[foo 5]: http://joeyespo.com/',
+        '    "Optional Title Here"',
+        '[bar]:',
+        '  http://example.com/bar',
+        '',
+        '```',
+        'code',
+        '',
+        'more code',
+        '```',
+        '',
+        '- item',
+        '',
+        '  continued',
+        '- item',
+        '',
+        '    indented',
+        '',
+        'Footnote[^1].',
+        '',
+        '[^1]: Note',
+    ])
+    blocks, definitions = split_blocks(text)
+    assert blocks == [
+        '# Title',
+        'Paragraph with a [link][ref].',
+        '```\ncode\n\nmore code\n```',
+        '- item\n\n  continued\n- item\n\n    indented',
+        'Footnote[^1].',
+        '[^1]: Note',
+    ]
+    assert definitions == [
+        '[ref]: http://example.com',
+        '[foo 5]: http://joeyespo.com/\n    "Optional Title Here"',
+        '[bar]:\n  http://example.com/bar',
+    ]
+    assert split_blocks('') == ([], [])
+    assert split_blocks('~~~\nunclosed\n\nfence') == (
+        ['~~~\nunclosed\n\nfence'], [])
+
+
+def test_incremental_renderer():
+    inner = ParagraphRendererMock()
+    renderer = IncrementalRenderer(inner)
+    assert renderer.user_content == inner.user_content
+    assert renderer.rendered is inner.rendered
+
+    text = 'One\n\nTwo\n\n[ref]: http://example.com\n\nThree'
+    assert renderer.render(text) == '<p>One</p>\n<p>Two</p>\n<p>Three</p>'
+    assert len(inner.rendered) == 1
+
+    # Only the changed block is sent to the wrapped renderer
+    text = text.replace('Two', 'Changed')
+    assert (renderer.render(text) ==
+            '<p>One</p>\n<p>Changed</p>\n<p>Three</p>')
+    assert len(inner.rendered) == 2
+    assert inner.rendered[-1] == 'Changed\n\n[ref]: http://example.com'
+
+    assert (renderer.render(text) ==
+            '<p>One</p>\n<p>Changed</p>\n<p>Three</p>')
+    assert len(inner.rendered) == 2
+
+    # Changing a definition re-renders every block that might use it
+    text = text.replace('example.com', 'example.org')
+    renderer.render(text)
+    assert len(inner.rendered) == 3
+    assert inner.rendered[-1].startswith('One\n\ngrip-block-')
+
+    # Markers are found in paragraphs with attributes, like with a context
+    inner = ParagraphRendererMock(attrs=' dir="auto"')
+    renderer = IncrementalRenderer(inner)
+    for _ in range(3):
+        assert renderer.render('One\n\nTwo') == (
+            '<p dir="auto">One</p>\n<p dir="auto">Two</p>')
+    assert len(inner.rendered) == 1
+
+
 def test_offline_renderer():
     # TODO: Test all GitHub rendering features and get the renderer to pass
     # FUTURE: Expose OfflineRenderer once all Markdown features are tested
-    pass
+    renderer = OfflineRenderer(pool_size=1)
+    assert renderer.render('# Title') == '<h1 id="title">Title</h1>'
+    assert len(renderer._engines) == 1
+    engine = renderer._engines[0]
+
+    # Engines are reused and reset, so anchors don't leak between renders
+    assert renderer.render('# Title') == '<h1 id="title">Title</h1>'
+    assert renderer._engines == [engine]
+
+    # Concurrent renders get their own engines, up to pool_size are kept
+    engines = [renderer._acquire_engine(), renderer._acquire_engine()]
+    assert engines[0] is engine and engines[1] is not engine
+    for engine in engines:
+        renderer._release_engine(engine)
+    assert len(renderer._engines) == 1
+
+
+def test_patcher():
+    html = ('<h1><a><span>{:"aria-hidden"=&gt;"true", :class=&gt;'
+            '"octicon octicon-link"}</span></a>Title</h1>\n'
+            '<ul>\n<li>[ ] Todo</li>\n<li>[x] Done<ul>\n'
+            '<li>[ ] Nested</li>\n</ul>\n</li>\n</ul>\n')
+    patched = patch(html)
+    assert '<span class="octicon octicon-link"></span>' in patched
+    assert patched.count('class="task-list-item"') == 3
+    assert patched.count('checked=""') == 1
+    assert patch(html, user_content=True).count('<li>[ ] ') == 2
+
+    # Fix-ups can be added, including ones with top-level alternation
+    patcher = Patcher(default_patcher.fixups)
+    patcher.register('emoji', r'<g-emoji>(\w+)</g-emoji>', r':\1:')
+    html += '<p><g-emoji>smile</g-emoji></p>\n'
+    patched = patcher.patch(html)
+    assert '<p>:smile:</p>' in patched
+    patcher.unregister('emoji')
+    assert patcher.patch(html) == patch(html)
+    patcher = Patcher()
+    patcher.register('x', r'<b>|<i>', '*')
+    assert (patcher.patch('<p><b>bold</b> <i>it</i></p>') ==
+            '<p>*bold</b> *it</i></p>')
+
+    # Patterns that can't be combined are rejected when they're registered
+    with pytest.raises(ValueError):
+        patcher.register('y', r'(?i)<B>', '*')
+    assert [fixup.name for fixup in patcher.fixups] == ['x']
+    assert patcher.patch('<b>') == '*'
+    patcher.register('y', r'(?i:<U>)', '_')
+    assert patcher.patch('<b><u>') == '*_'
+
+
+def test_prune_unused_styles(monkeypatch, tmpdir):
+    used = UsedSelectors()
+    used.feed('<html><body><div id="readme" class="markdown-body md:flex">'
+              '<p>Text <a href="#">link</a></p></div></body></html>')
+    css = (
+        '/*! License */ @charset "utf-8"; :root { --font: octicons; }\n'
+        '.markdown-body p { margin: 0; } .md\\:flex { display: flex; }\n'
+        '.unused, a:hover, div > .markdown-body { color: red; }\n'
+        'table:not(.unused) td { padding: 0; } #readme { margin: 0; }\n'
+        '[data-color-mode=dark] .markdown-body { color: white; }\n'
+        'a[title="{;}"] { color: blue; }\n'
+        '@media (max-width: 768px) { .unused { x: 1; } #readme { x: 2; } }\n'
+        '@media print { .unused { x: 1; } }\n'
+        '@font-face { font-family: "octicons"; src: url(data:a); }\n'
+        '@font-face { font-family: unused; src: url(data:b); }\n'
+        '.markdown-body { font-family: var(--font); animation: spin 1s; }\n'
+        '@keyframes spin { to { x: 1; } } @keyframes fade { to { x: 1; } }')
+    assert prune_css(css, used) == (
+        '@charset "utf-8";:root{ --font: octicons; }'
+        '.markdown-body p{ margin: 0; }.md\\:flex{ display: flex; }'
+        'a:hover,div > .markdown-body{ color: red; }'
+        '#readme{ margin: 0; }'
+        '[data-color-mode=dark] .markdown-body{ color: white; }'
+        'a[title="{;}"]{ color: blue; }'
+        '@media (max-width: 768px){#readme{ x: 2; }}'
+        '@font-face{ font-family: "octicons"; src: url(data:a); }'
+        '.markdown-body{ font-family: var(--font); animation: spin 1s; }'
+        '@keyframes spin{ to { x: 1; } }')
+
+    # Exported pages only keep the rules their elements use
+    monkeypatch.setenv('GRIPHOME', str(tmpdir))
+    readme = tmpdir.join(DEFAULT_FILENAME)
+    readme.write_text('# Title\n\nText\n', 'utf-8')
+    exported = tmpdir.join('exported.html')
+    for prune_styles in [False, True]:
+        export(str(readme), render_offline=True, out_filename=str(exported),
+               quiet=True, grip_class=GripMock, prune_styles=prune_styles)
+        page = exported.read_text('utf-8')
+        assert '.preview-page' in page
+        assert ('.discussion-timeline.wide' in page) != prune_styles
+        assert '<h1' in page
 
 
 def test_readme_asset_manager():
@@ -230,7 +788,7 @@ def test_readme_asset_manager():
         ReadmeRenderer()
 
 
-def test_github_asset_manager(tmpdir):
+def test_github_asset_manager(monkeypatch, tmpdir):
     cache_dir = tmpdir.mkdir('cache-dummy')
     assets = GitHubAssetManager(str(cache_dir))
 
@@ -240,8 +798,84 @@ def test_github_asset_manager(tmpdir):
     assets.clear()
     assert not cache_dir.check()
 
-    # TODO: Test style retrieval on a fresh cache
-    # TODO: Test that an existing cache is used when styles are requested
+    # Styles and their assets are downloaded into a fresh cache
+    style_source = (
+        '<link crossorigin="anonymous" media="all" rel="stylesheet" '
+        'href="https://github.githubassets.com/github-1.css" />\n'
+        '<link crossorigin="anonymous" media="all" rel="stylesheet" '
+        'href="https://github.githubassets.com/frameworks-2.css" />\n')
+    font_url = ('https://github.githubassets.com'
+                '/static/fonts/octicons/octicons.woff')
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.GET, STYLE_URLS_SOURCE, body=style_source)
+        rsps.add(responses.GET,
+                 'https://github.githubassets.com/github-1.css',
+                 body='@font-face { src: url(/static/fonts/octicons/'
+                      'octicons.woff); }\n', content_type='text/css')
+        rsps.add(responses.GET,
+                 'https://github.githubassets.com/frameworks-2.css',
+                 body='.frameworks {}\n', content_type='text/css')
+        rsps.add(responses.GET, font_url, status=500)
+        assets = GitHubAssetManager(str(cache_dir), quiet=True)
+        # Nothing is considered cached until every download succeeded
+        assets.retrieve_styles('/__/grip/asset/')
+        assert not cache_dir.join(ASSET_MANIFEST_FILENAME).check()
+        assert assets._get_cached_style_urls('/__/grip/asset/') == []
+
+        rsps.replace(responses.GET, font_url, body=b'wOFF')
+        assets = GitHubAssetManager(str(cache_dir), quiet=True)
+        assets.retrieve_styles('/__/grip/asset/')
+    assert cache_dir.join('octicons.woff').read_binary() == b'wOFF'
+    assert cache_dir.join('github-1.css.gz').check()
+    assert not cache_dir.join('octicons.woff.gz').check()
+
+    # The manifest lists the styles in order and versions their URLs
+    manifest = json.loads(cache_dir.join(ASSET_MANIFEST_FILENAME).read())
+    assert manifest['styles'] == ['github-1.css', 'frameworks-2.css']
+    assert sorted(manifest['files']) == [
+        'frameworks-2.css', 'github-1.css', 'octicons.woff']
+    font = manifest['files']['octicons.woff']
+    assert font['url'] == font_url
+    assert font['size'] == 4
+    assert font['sha256'] == hashlib.sha256(b'wOFF').hexdigest()
+    assert cache_dir.join('github-1.css').read_text('utf-8') == (
+        '@font-face {{ src: url("/__/grip/asset/static/fonts/octicons/'
+        'octicons.woff?v={0}"); }}\n'.format(font['sha256'][:16]))
+    style_urls = [
+        '/__/grip/asset/{0}?v={1}'.format(
+            style, manifest['files'][style]['sha256'][:16])
+        for style in manifest['styles']]
+    assert assets.style_urls == style_urls
+
+    # An existing cache is used when styles are requested
+    with responses.RequestsMock():
+        assets = GitHubAssetManager(str(cache_dir), quiet=True)
+        assets.retrieve_styles('/__/grip/asset/')
+    assert assets.style_urls == style_urls
+    assert assets.cached_digest('octicons.woff') == font['sha256']
+    assert assets.cached_digest('unknown.woff') is None
+
+    # Versioned URLs can be cached by browsers indefinitely
+    monkeypatch.setenv('GRIPHOME', str(tmpdir))
+    app = GripMock(TextReader('Cached'), renderer=ParagraphRendererMock(),
+                   assets=assets)
+    with app.test_client() as client:
+        response = client.get(style_urls[0])
+        assert response.data == cache_dir.join('github-1.css').read_binary()
+        assert 'immutable' in response.headers['Cache-Control']
+        for version in ['0', assets.cached_digest('github-1.css')[:1]]:
+            response = client.get(
+                '/__/grip/asset/github-1.css?v={0}'.format(version))
+            assert 'immutable' not in response.headers.get(
+                'Cache-Control', '')
+
+    # Files are checked against the manifest when they're first used
+    cache_dir.join('frameworks-2.css').write_text('.changed {}\n', 'utf-8')
+    assets = GitHubAssetManager(str(cache_dir), quiet=True)
+    assert assets.cached_digest('frameworks-2.css') is None
+    assert not cache_dir.join(ASSET_MANIFEST_FILENAME).check()
+    assert assets._get_cached_style_urls('/__/grip/asset/') == []
+
     # TODO: Test the upgrade case (cache-x.y.z should be fresh)
 
 
@@ -262,13 +896,20 @@ def test_app(monkeypatch, tmpdir):
         assert Grip(zero_path, assets=assets).render('/x/../') == zero_output
         with Grip(zero_path, assets=assets).test_client() as client:
             assert client.get('/').data.decode('utf-8') == zero_output
-        assert len(responses.calls) == 4
+        # Renders are shared through the on-disk render cache in GRIPHOME
+        assert len(responses.calls) == 1
 
     with GitHubRequestsMock() as responses:
         app = Grip(gfm_test_path, assets=assets)
         assert app.render() == gfm_test_output
         assert app.render('/') == gfm_test_output
-        assert len(responses.calls) == 2
+        assert len(responses.calls) == 1
+
+    with GitHubRequestsMock() as responses:
+        app = Grip(gfm_test_path, assets=assets)
+        app.clear_cache()
+        assert app.render() == gfm_test_output
+        assert len(responses.calls) == 1
 
     # TODO: Test all constructor parameters
     # TODO: Test other methods
@@ -277,9 +918,493 @@ def test_app(monkeypatch, tmpdir):
     # TODO: Test behaviors? -> anchor tags, autorefresh
 
 
+def test_app_conditional(monkeypatch, tmpdir):
+    monkeypatch.setenv('GRIPHOME', str(tmpdir))
+    readme = tmpdir.join(DEFAULT_FILENAME)
+    readme.write_text('Before', 'utf-8')
+    tmpdir.join('image.png').write_binary(b'\x89PNG')
+    renderer = ParagraphRendererMock()
+    app = GripMock(DirectoryReader(str(tmpdir)), renderer=renderer)
+
+    with app.test_client() as client:
+        response = client.get('/')
+        etag = response.headers['ETag']
+        last_modified = response.headers['Last-Modified']
+        assert 'no-cache' in response.headers['Cache-Control']
+        assert renderer.rendered == ['Before']
+
+        # Unchanged pages aren't rendered again
+        response = client.get('/', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.data == b''
+        response = client.get(
+            '/', headers={'If-Modified-Since': last_modified})
+        assert response.status_code == 304
+        assert renderer.rendered == ['Before']
+
+        # Changed pages or settings are
+        readme.write_text('After', 'utf-8')
+        readme.setmtime(readme.mtime() + 10)
+        response = client.get('/', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.headers['ETag'] != etag
+        app.theme = 'dark'
+        assert client.get('/', headers={
+            'If-None-Match': response.headers['ETag']}).status_code == 200
+        assert renderer.rendered == ['Before', 'After', 'After']
+
+        response = client.get('/image.png')
+        assert response.data == b'\x89PNG'
+        assert response.headers['Accept-Ranges'] == 'bytes'
+        assert response.headers['Content-Length'] == '4'
+        assert client.get('/image.png', headers={
+            'If-None-Match': response.headers['ETag']}).status_code == 304
+
+        # Binary assets can be read in ranges, like when seeking videos
+        response = client.get('/image.png', headers={'Range': 'bytes=1-2'})
+        assert response.status_code == 206
+        assert response.data == b'PN'
+        assert response.headers['Content-Range'] == 'bytes 1-2/4'
+
+
+def test_app_compression(monkeypatch, tmpdir):
+    monkeypatch.setenv('GRIPHOME', str(tmpdir))
+    reader = TextReader('\n\n'.join(['Compressible'] * 200))
+    app = GripMock(reader, renderer=ParagraphRendererMock())
+    gzip_headers = {'Accept-Encoding': 'gzip'}
+
+    with app.test_client() as client:
+        page = client.get('/').data
+        response = client.get('/', headers=gzip_headers)
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response.headers['Vary']
+        assert len(response.data) < len(page)
+        assert zlib.decompress(response.data, 16 + zlib.MAX_WBITS) == page
+
+        # Compressed pages still answer conditional requests
+        etag = response.headers['ETag']
+        assert etag.startswith('W/')
+        assert client.get('/', headers={
+            'If-None-Match': etag}).status_code == 304
+
+        # Small responses and clients that don't accept it are sent as is
+        assert 'Content-Encoding' not in client.get('/').headers
+        app.config['COMPRESSION_MIN_SIZE'] = len(page) + 1
+        response = client.get('/', headers=gzip_headers)
+        assert 'Content-Encoding' not in response.headers
+        assert response.data == page
+
+    # Each streamed chunk can be read as soon as it's received
+    chunks = [b'data: {"content": "<p>Compressible</p>"}\r\n\r\n'] * 3
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    compressed = list(compress_stream(iter(chunks), 'gzip'))
+    for chunk, data in zip(chunks, compressed):
+        assert decompressor.decompress(data) == chunk
+    assert len(compressed[1]) < len(compressed[0])
+    assert decompressor.decompress(b''.join(compressed[3:])) == b''
+    assert decompressor.eof
+
+    # Cached styles are served precompressed
+    cache_dir = tmpdir.mkdir('cache-dummy')
+    style = cache_dir.join('style.css')
+    style.write_text('.markdown-body { color: #24292f; }\n' * 100, 'utf-8')
+    cache_dir.join('octicons.woff').write_binary(b'wOFF')
+    variants = precompress('style.css', style.read_binary(), ['gzip'])
+    assert list(variants) == ['gzip']
+    cache_dir.join('style.css.gz').write_binary(variants['gzip'])
+    assert precompress('octicons.woff', b'wOFF') == {}
+    assert sorted(cache_dir.listdir()) == [
+        cache_dir.join('octicons.woff'), style, cache_dir.join('style.css.gz')]
+    app = GripMock(reader, renderer=ParagraphRendererMock())
+    app.assets.cache_path = str(cache_dir)
+    with app.test_client() as client:
+        response = client.get('/__/grip/asset/style.css', headers=gzip_headers)
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert response.mimetype == 'text/css'
+        assert zlib.decompress(
+            response.data, 16 + zlib.MAX_WBITS) == style.read_binary()
+        response = client.get('/__/grip/asset/style.css')
+        assert 'Content-Encoding' not in response.headers
+        assert response.data == style.read_binary()
+
+
+def test_app_styles_in_background(monkeypatch, tmpdir):
+    monkeypatch.setenv('GRIPHOME', str(tmpdir))
+    app = GripMock(TextReader('Styled'), renderer=ParagraphRendererMock(),
+                   render_inline=True)
+    octicons_url = '/__/grip/static/octicons/octicons.css'
+    retrieving = threading.Event()
+    retrieved = threading.Event()
+
+    def retrieve_styles(asset_url_path):
+        retrieving.set()
+        retrieved.wait(5)
+        app.assets.style_urls.append(octicons_url)
+    monkeypatch.setattr(app.assets, 'retrieve_styles', retrieve_styles)
+
+    thread = app.retrieve_styles_in_background()
+    assert retrieving.wait(5)
+    assert not app.styles_ready
+    assert app.retrieve_styles_in_background() is None
+
+    # Requests wait for the styles instead of retrieving them again
+    pages = []
+    request_thread = threading.Thread(
+        target=lambda: pages.append(app.render()))
+    request_thread.start()
+    time.sleep(0.1)
+    assert pages == []
+    retrieved.set()
+    thread.join(5)
+    request_thread.join(5)
+    assert app.styles_ready
+    # Styles are inlined in the background too, through nested requests
+    assert app.assets.style_urls == []
+    assert len(app.assets.styles) == 1
+    assert '.octicon' in app.assets.styles[0]
+    assert '<p>Styled</p>' in pages[0]
+    assert '.octicon' in pages[0]
+
+
+def test_app_inline_styles(monkeypatch, tmpdir):
+    monkeypatch.setenv('GRIPHOME', str(tmpdir))
+    monkeypatch.setattr('grip.app._inline_styles_cache', RenderCache())
+    cache_dir = tmpdir.mkdir('cache-dummy')
+    font = b'wOFF'
+    font_digest = hashlib.sha256(font).hexdigest()
+    files = {'octicons.woff': font}
+    for name in ['github-1.css', 'frameworks-2.css']:
+        files[name] = (
+            '.{0} {{ src: url("/__/grip/asset/static/fonts/octicons/'
+            'octicons.woff?v={1}"); }}\n'.format(
+                name[:-6], font_digest[:16])).encode('utf-8')
+    for name, data in files.items():
+        cache_dir.join(name).write_binary(data)
+    cache_dir.join(ASSET_MANIFEST_FILENAME).write_text(json.dumps({
+        'version': ASSET_MANIFEST_VERSION,
+        'styles': ['github-1.css', 'frameworks-2.css'],
+        'files': dict((name, {
+            'url': 'https://github.githubassets.com/' + name,
+            'size': len(data), 'sha256': hashlib.sha256(data).hexdigest(),
+        }) for name, data in files.items()),
+    }), 'utf-8')
+
+    def create_app():
+        assets = GitHubAssetManager(str(cache_dir), quiet=True)
+        return GripMock(TextReader('Inline'), renderer=ParagraphRendererMock(),
+                        assets=assets, render_inline=True)
+
+    downloads = []
+    download = Grip._download
+
+    def record_download(self, url, binary=False):
+        if url.startswith('/__/grip/asset/'):
+            downloads.append(url)
+        return download(self, url, binary)
+    monkeypatch.setattr(Grip, '_download', record_download)
+
+    # Styles are inlined with each shared font downloaded once
+    page = create_app().render()
+    data_url = 'url(data:font/woff;base64,d09GRg==)'
+    assert page.count(data_url) == 2
+    assert '/__/grip/asset/' not in page
+    assert len(downloads) == 3
+
+    # Inlined styles are reused by later apps and runs
+    assert create_app().render() == page
+    monkeypatch.setattr('grip.app._inline_styles_cache', RenderCache())
+    assert create_app().render() == page
+    assert len(downloads) == 3
+
+    # Changed styles are inlined again
+    monkeypatch.setattr('grip.app._inline_styles_cache', RenderCache())
+    cache_dir.join('frameworks-2.css').write_text('.changed {}\n', 'utf-8')
+    create_app().render()
+    assert len(downloads) == 6
+
+
+def test_app_stale_while_revalidate(monkeypatch, tmpdir):
+    monkeypatch.setenv('GRIPHOME', str(tmpdir))
+    renderer = ParagraphRendererMock(delay=0.5)
+    reader = TextReader('Before')
+    app = GripMock(reader, renderer=renderer)
+    app.stale_while_revalidate = True
+
+    # Stale content is only served while a server can push the fresh one
+    with app.test_client() as client:
+        assert '<p>Before</p>' in client.get('/').data.decode('utf-8')
+    app._shutdown_event = threading.Event()
+
+    reader.text = 'After'
+    with app.test_client() as client:
+        start = time.time()
+        page = client.get('/').data.decode('utf-8')
+        assert time.time() - start < renderer.delay
+        assert '<p>Before</p>' in page
+        assert ' data-stale>' in page
+        assert '/__/grip/refresh/?revalidate=1' in page
+
+        response = client.get('/__/grip/refresh/?revalidate=1')
+        event = next(response.response).decode('utf-8')
+        assert json.loads(event.split('data: ', 1)[1]) == {
+            'content': '<p>After</p>'}
+        response.close()
+    assert renderer.rendered == ['Before', 'After']
+
+    # The last render is also persisted for the next server
+    app = GripMock(reader, renderer=ParagraphRendererMock(delay=0.5))
+    app.stale_while_revalidate = True
+    app._shutdown_event = threading.Event()
+    reader.text = 'Again'
+    with app.test_client() as client:
+        assert '<p>After</p>' in client.get('/').data.decode('utf-8')
+    app._shutdown_event.set()
+
+
+def test_highlight_cache(monkeypatch):
+    import grip.highlight
+    calls = []
+
+    def highlight(code, lexer, formatter):
+        calls.append(code)
+        return '<pre>{0}</pre>'.format(code)
+    monkeypatch.setattr(grip.highlight, 'highlight', highlight)
+
+    cache = HighlightCache(max_size=2)
+    assert cache.highlight('x = 1\n', 'python') == '<pre>x = 1\n</pre>'
+    assert cache.highlight('x = 1\n', 'python') == '<pre>x = 1\n</pre>'
+    assert calls == ['x = 1\n']
+    assert cache.lexer_for('python') is cache.lexer_for('python')
+    assert cache.lexer_for('no-such-language').name == 'Text only'
+
+    # Only code blocks that changed are highlighted again
+    renderer = OfflineRenderer(highlight_cache=cache)
+    text = 'Before\n\n```python\nx = 1\n```\n'
+    content = renderer.render(text)
+    assert '<pre>x = 1\n</pre>' in content
+    renderer.render(text.replace('Before', 'After'))
+    assert calls == ['x = 1\n']
+    renderer.render(text.replace('x = 1', 'x = 2'))
+    assert calls == ['x = 1\n', 'x = 2\n']
+
+    # Unlabelled code and unknown languages are left for codehilite to guess
+    monkeypatch.undo()
+    content = renderer.render('```\n#!/usr/bin/env python\nimport os\n```\n')
+    assert '<span class="kn">import</span>' in content
+    assert not cache.has_lexer('unmatched_language')
+    text = ('```unmatched_language\n'
+            "console.log('No matching language, but looks like JavaScript.');"
+            '\n```\n')
+    assert 'console.log' in renderer.render(text)
+    assert calls == ['x = 1\n', 'x = 2\n']
+
+
+def test_app_render_stream(monkeypatch, tmpdir):
+    monkeypatch.setenv('GRIPHOME', str(tmpdir))
+    readme = tmpdir.join(DEFAULT_FILENAME)
+    lines = ''.join('Line [{0}][link]\n\n'.format(i) for i in range(200))
+    readme.write_text(
+        '# Title\n\n' + lines + '[link]: http://example.com\n', 'utf-8')
+    reader = DirectoryReader(str(tmpdir))
+    assert reader.size() == readme.size()
+    assert ''.join(reader.iter_lines()) == reader.read()
+
+    renderer = OfflineRenderer()
+    chunks = list(renderer.render_stream(reader.iter_lines(), 256))
+    assert len(chunks) > 1
+    assert chunks[0].startswith('<h1 id="title">Title</h1>')
+    assert '<a href="http://example.com">199</a>' in chunks[-1]
+
+    app = GripMock(reader, renderer=renderer)
+    app.config['RENDER_STREAM_THRESHOLD'] = readme.size()
+    with app.test_client() as client:
+        response = client.get('/')
+        assert 'Content-Length' not in response.headers
+        assert 'ETag' not in response.headers
+        assert 'Last-Modified' not in response.headers
+        assert response.cache_control.no_store
+        page = response.data.decode('utf-8')
+    assert '<p>Line <a href="http://example.com">199</a></p>' in page
+    assert page.rstrip().endswith('</html>')
+    assert 'grip-content-' not in page
+
+    app.config['RENDER_STREAM_THRESHOLD'] = readme.size() + 1
+    with app.test_client() as client:
+        assert 'Content-Length' in client.get('/').headers
+
+
+def test_process_pool_renderer():
+    renderer = ProcessPoolRenderer(max_workers=2, max_pending=1)
+    text = '# Title\n\n```python\nx = 1\n```\n'
+    try:
+        assert renderer.render(text) == OfflineRenderer().render(text)
+        threads = [threading.Thread(target=renderer.render, args=(text,))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        renderer.close()
+    assert renderer._executor is None
+
+    # A pool broken by a worker that died is replaced
+    if hasattr(signal, 'SIGKILL'):
+        renderer = ProcessPoolRenderer(max_workers=1)
+        try:
+            assert renderer.render(text) == OfflineRenderer().render(text)
+            executor = renderer._executor
+            for process in list(executor._processes.values()):
+                os.kill(process.pid, signal.SIGKILL)
+                process.join()
+            assert renderer.render(text) == OfflineRenderer().render(text)
+            assert renderer._executor is not executor
+        finally:
+            renderer.close()
+
+    # Workers can be started early and are closed through wrappers
+    renderer = IncrementalRenderer(ProcessPoolRenderer(max_workers=2))
+    try:
+        renderer.start()
+        assert renderer.renderer._executor is not None
+        assert renderer.render(text) == OfflineRenderer().render(text)
+    finally:
+        renderer.close()
+    assert renderer.renderer._executor is None
+
+
+def test_hybrid_renderer(monkeypatch, tmpdir):
+    monkeypatch.setenv('GRIPHOME', str(tmpdir))
+    renderer = HybridRenderer(ParagraphRendererMock(delay=0.5))
+    assert isinstance(renderer.preview_renderer, OfflineRenderer)
+    assert renderer.render('# Title') == '<p># Title</p>'
+    assert renderer.render_preview('# Title') == '<h1 id="title">Title</h1>'
+    assert renderer.rendered == ['# Title']
+
+    # The preview is served while the accurate render is in flight
+    reader = TextReader('# Title')
+    app = GripMock(reader, renderer=renderer)
+    app._shutdown_event = threading.Event()
+    with app.test_client() as client:
+        start = time.time()
+        page = client.get('/').data.decode('utf-8')
+        assert time.time() - start < renderer.renderer.delay
+        assert '<h1 id="title">Title</h1>' in page
+        assert ' data-stale>' in page
+        assert '/__/grip/refresh/?revalidate=1' in page
+
+        response = client.get('/__/grip/refresh/?revalidate=1')
+        event = next(response.response).decode('utf-8')
+        assert json.loads(event.split('data: ', 1)[1]) == {
+            'content': '<p># Title</p>'}
+        response.close()
+    app._shutdown_event.set()
+
+    # Changes are previewed before they're rendered
+    readme = tmpdir.join(DEFAULT_FILENAME)
+    readme.write_text('# Before', 'utf-8')
+    hub = RefreshHub(
+        DirectoryReader(str(tmpdir)), lambda subpath, text: 'accurate',
+        quiet=True, timeout=0.05,
+        preview=lambda subpath, text: 'preview')
+    subscription = hub.subscribe(None)
+    readme.write_text('# After', 'utf-8')
+    readme.setmtime(readme.mtime() + 10)
+    assert subscription.get(timeout=5) == {'updating': True}
+    assert subscription.get(timeout=5) == {
+        'content': 'preview', 'preview': True}
+    assert subscription.get(timeout=5) == {'content': 'accurate'}
+    hub.unsubscribe(subscription)
+
+    app = create_app(grip_class=GripMock, render_hybrid=True)
+    assert isinstance(app.renderer, HybridRenderer)
+    assert isinstance(app.renderer.renderer, FallbackRenderer)
+    assert isinstance(app.renderer.renderer.renderer, GitHubRenderer)
+    assert app.renderer.session is app.session
+
+
+def test_circuit_breaker(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    breaker = CircuitBreaker(max_failures=2, reset_timeout=30)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.status()['retry_in'] == 30
+
+    # A single probe is let through once the reset timeout has passed
+    now[0] += 30
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    now[0] += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.status() == {
+        'state': 'closed', 'failures': 0, 'retry_in': 0}
+
+
+@responses.activate
+def test_fallback_renderer():
+    url = '{0}/markdown/raw'.format(DEFAULT_API_URL)
+    responses.add(responses.POST, url, body=requests.ConnectionError())
+    breaker = CircuitBreaker(max_failures=2)
+    renderer = FallbackRenderer(GitHubRenderer(), breaker=breaker)
+    assert renderer.api_url == DEFAULT_API_URL
+
+    # Failed renders fall back until the breaker opens and skips the API
+    for _ in range(3):
+        content = renderer.render('# Title')
+        assert content.startswith('<div class="grip-renderer-banner">')
+        assert 'OfflineRenderer' in content
+        assert '<h1 id="title">Title</h1>' in content
+    assert len(responses.calls) == 2
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # Client errors are raised instead of hidden by the fallback
+    responses.replace(responses.POST, url, status=422)
+    renderer = FallbackRenderer(GitHubRenderer(), breaker=CircuitBreaker())
+    with pytest.raises(HTTPError):
+        renderer.render('# Title')
+    responses.replace(responses.POST, url, body='<p>ok</p>')
+    assert renderer.render('ok') == '<p>ok</p>'
+
+
 def test_api():
     assert isinstance(create_app(grip_class=GripMock), GripMock)
 
+    app = create_app(grip_class=GripMock)
+    with app.test_client() as client:
+        status = client.get('/__/grip/rate-limit').get_json()
+        assert status['remaining'] is None
+        assert status['reserve'] == app.config['RATE_LIMIT_RESERVE']
+
+    session = PooledSessionMock()
+    app = create_app(user_content=True, grip_class=GripMock, session=session)
+    assert app.session is session
+    assert app.renderer.session is session
+    assert app.assets.session is session
+    assert isinstance(create_app(grip_class=GripMock).session, PooledSession)
+
+    # Exported pages aren't rendered offline when the API is unavailable
+    assert isinstance(create_app(grip_class=GripMock).renderer,
+                      FallbackRenderer)
+    app = create_app(grip_class=GripMock, render_fallback=False)
+    assert isinstance(app.renderer, GitHubRenderer)
+    with responses.RequestsMock() as mock:
+        mock.add(responses.POST, '{0}/markdown/raw'.format(DEFAULT_API_URL),
+                 body=requests.ConnectionError())
+        page = render_page(text='# Title', grip_class=GripMock)
+    assert 'grip-renderer-banner' not in page
+
     # TODO: Test all API functions and argument combinations
 
 